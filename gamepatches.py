@@ -1000,6 +1000,89 @@ def highest_objid(bzs):
     return max_id
 
 
+class BzsIndex:
+    """
+    Index of the objects of a parsed bzs, by section and id and by section and name.
+    A section is only indexed the first time an object is looked up in it, objects
+    must be added, removed or renamed through the index to keep it up to date
+    """
+
+    def __init__(self, bzs: OrderedDict):
+        self.bzs = bzs
+        # (layer, objtype) -> id -> objects
+        self.by_id = {}
+        # (layer, objtype) -> name -> objects
+        self.by_name = {}
+        self.max_id = None
+
+    def get_list(self, layer: Optional[int], objtype: str, create: bool = False):
+        node = self.bzs if layer is None else self.bzs["LAY "][f"l{layer}"]
+        if create and objtype not in node:
+            node[objtype] = []
+        return node.get(objtype, [])
+
+    def _ids(self, layer: Optional[int], objtype: str) -> dict:
+        key = (layer, objtype)
+        if (ids := self.by_id.get(key)) is None:
+            ids = defaultdict(list)
+            for obj in self.get_list(layer, objtype):
+                ids[obj.get("id")].append(obj)
+            self.by_id[key] = ids
+        return ids
+
+    def _names(self, layer: Optional[int], objtype: str) -> dict:
+        key = (layer, objtype)
+        if (names := self.by_name.get(key)) is None:
+            names = defaultdict(list)
+            for obj in self.get_list(layer, objtype):
+                names[obj.get("name")].append(obj)
+            self.by_name[key] = names
+        return names
+
+    def with_id(self, layer: Optional[int], objtype: str, id: int) -> list:
+        return self._ids(layer, objtype).get(id, [])
+
+    def with_name(self, layer: Optional[int], objtype: str, name: str) -> list:
+        return self._names(layer, objtype).get(name, [])
+
+    def _track_max_id(self):
+        # new ids are numbered from the objects the bzs had before any change
+        if self.max_id is None:
+            self.max_id = highest_objid(self.bzs)
+
+    def invalidate(self, layer: Optional[int], objtype: str):
+        self._track_max_id()
+        self.by_id.pop((layer, objtype), None)
+        self.by_name.pop((layer, objtype), None)
+
+    def add(self, layer: Optional[int], objtype: str, obj: OrderedDict):
+        self._track_max_id()
+        self.get_list(layer, objtype, create=True).append(obj)
+        key = (layer, objtype)
+        if (ids := self.by_id.get(key)) is not None:
+            ids[obj.get("id")].append(obj)
+        if (names := self.by_name.get(key)) is not None:
+            names[obj.get("name")].append(obj)
+
+    def remove(self, layer: Optional[int], objtype: str, obj: OrderedDict):
+        def remove_from(objs):
+            del objs[next(i for i, x in enumerate(objs) if x is obj)]
+
+        self._track_max_id()
+        remove_from(self.get_list(layer, objtype))
+        key = (layer, objtype)
+        if (ids := self.by_id.get(key)) is not None:
+            remove_from(ids[obj.get("id")])
+        if (names := self.by_name.get(key)) is not None:
+            remove_from(names[obj.get("name")])
+
+    def next_id(self) -> int:
+        """A new object id, above all the ids of the bzs"""
+        self._track_max_id()
+        self.max_id += 1
+        return self.max_id
+
+
 def mask_shift_set(value, mask, shift, new_value):
     """
     Replace new_value in value, by applying the mask after the shift
@@ -1174,104 +1257,103 @@ def patch_key_bokoblin_item(boko: OrderedDict, itemid: int):
 
 
 # not treasure chest, wardrobes you can open, used for zelda room HP
-def rando_patch_chest(bzs: OrderedDict, itemid: int, id: str):
+def rando_patch_chest(index: BzsIndex, layer: int, itemid: int, id: str):
     id = int(id)
     chest = next(
         filter(
-            lambda x: x["name"] == "chest" and (x["params1"] & 0xFF) == id, bzs["OBJ "]
+            lambda x: (x["params1"] & 0xFF) == id,
+            index.with_name(layer, "OBJ ", "chest"),
         )
     )
     patch_chest_item(chest, itemid)
 
 
-def rando_patch_heartco(bzs: OrderedDict, itemid: int, id: str):
-    obj = next(
-        filter(lambda x: x["name"] == "HeartCo", bzs["OBJ "])
-    )  # there is only one heart container at a time
+def rando_patch_heartco(index: BzsIndex, layer: int, itemid: int, id: str):
+    # there is only one heart container at a time
+    obj = index.with_name(layer, "OBJ ", "HeartCo")[0]
     patch_heart_co(obj, itemid)
 
 
-def rando_patch_warpobj(bzs: OrderedDict, itemid: int, id: str):
-    obj = next(
-        filter(lambda x: x["name"] == "WarpObj", bzs["OBJ "])
-    )  # there is only one trial exit at a time
+def rando_patch_warpobj(index: BzsIndex, layer: int, itemid: int, id: str):
+    # there is only one trial exit at a time
+    obj = index.with_name(layer, "OBJ ", "WarpObj")[0]
     patch_trial_item(obj, itemid)
 
 
-def rando_patch_tbox(bzs: OrderedDict, itemid: int, id: str, dowsing: int):
+def rando_patch_tbox(index: BzsIndex, layer: int, itemid: int, id: str, dowsing: int):
     id = int(id)
-    tboxs = list(
-        filter(lambda x: x["name"] == "TBox" and (x["anglez"] >> 9) == id, bzs["OBJS"])
-    )
+    tboxs = [
+        x for x in index.with_name(layer, "OBJS", "TBox") if (x["anglez"] >> 9) == id
+    ]
     if len(tboxs) == 0:
         print(tboxs)
     obj = tboxs[0]  # anglez >> 9 is chest id
     patch_tbox_item(obj, itemid, dowsing)
 
 
-def rando_patch_item(bzs: OrderedDict, itemid: int, id: str):
+def rando_patch_item(index: BzsIndex, layer: int, itemid: int, id: str):
     id = int(id)
     obj = next(
         filter(
-            lambda x: x["name"] == "Item" and ((x["params1"] >> 10) & 0xFF) == id,
-            bzs["OBJ "],
+            lambda x: ((x["params1"] >> 10) & 0xFF) == id,
+            index.with_name(layer, "OBJ ", "Item"),
         )
     )  # (params1 >> 10) & 0xFF is sceneflag
     patch_item_item(obj, itemid)
 
 
-def rando_patch_chandelier(bzs: OrderedDict, itemid: int, id: str):
-    obj = next(filter(lambda x: x["name"] == "Chandel", bzs["OBJ "]))
+def rando_patch_chandelier(index: BzsIndex, layer: int, itemid: int, id: str):
+    obj = index.with_name(layer, "OBJ ", "Chandel")[0]
     patch_chandelier_item(obj, itemid)
 
 
-def rando_patch_soil(bzs: OrderedDict, itemid: int, id: str):
+def rando_patch_soil(index: BzsIndex, layer: int, itemid: int, id: str):
     id = int(id)
     obj = next(
         filter(
-            lambda x: x["name"] == "Soil" and ((x["params1"] >> 4) & 0xFF) == id,
-            bzs["OBJ "],
+            lambda x: ((x["params1"] >> 4) & 0xFF) == id,
+            index.with_name(layer, "OBJ ", "Soil"),
         )
     )  # (params1 >> 4) & 0xFF is sceneflag
     patch_soil_item(obj, itemid)
 
 
-def rando_patch_bokoblin(bzs: OrderedDict, itemid: int, id: str):
+def rando_patch_bokoblin(index: BzsIndex, layer: int, itemid: int, id: str):
     id = int(id, 0)
-    obj = next(filter(lambda x: x["name"] == "EBc" and x["id"] == id, bzs["OBJ "]))
+    obj = next(filter(lambda x: x["name"] == "EBc", index.with_id(layer, "OBJ ", id)))
     patch_key_bokoblin_item(obj, itemid)
 
 
-def rando_patch_goddess_crest(bzs: OrderedDict, itemid: int, index: str):
-    obj = next(filter(lambda x: x["name"] == "SwSB", bzs["OBJ "]))
+def rando_patch_goddess_crest(index: BzsIndex, layer: int, itemid: int, crest: str):
+    obj = index.with_name(layer, "OBJ ", "SwSB")[0]
     # we need to patch 3 item ids into this object:
     # 1 is params1 FF 00 00 00, 2 is params1 00 FF 00 00
     # 3 is params2 FF 00 00 00
-    if index == "0":
+    if crest == "0":
         obj["params1"] = mask_shift_set(obj["params1"], 0xFF, 0x18, itemid)
-    elif index == "1":
+    elif crest == "1":
         obj["params1"] = mask_shift_set(obj["params1"], 0xFF, 0x10, itemid)
-    elif index == "2":
+    elif crest == "2":
         obj["params2"] = mask_shift_set(obj["params2"], 0xFF, 0x18, itemid)
 
 
-def rando_patch_tadtone_group(bzs: OrderedDict, itemid: int, groupId: str):
+def rando_patch_tadtone_group(index: BzsIndex, layer: int, itemid: int, groupId: str):
     groupId = int(groupId, 0)
     clefs = filter(
-        lambda x: x["name"] == "Clef" and ((x["params1"] >> 3) & 0x1F) == groupId,
-        bzs["OBJ "],
+        lambda x: ((x["params1"] >> 3) & 0x1F) == groupId,
+        index.with_name(layer, "OBJ ", "Clef"),
     )
 
     for clef in clefs:
         clef["anglez"] = mask_shift_set(clef["anglez"], 0xFFFF, 0, itemid)
 
 
-def rando_patch_bell(bzs: OrderedDict, itemid: int, id: str):
-    bell = next(filter(lambda x: x["name"] == "Bell", bzs["OBJ "]))
+def rando_patch_bell(index: BzsIndex, layer: int, itemid: int, id: str):
+    bell = index.with_name(layer, "OBJ ", "Bell")[0]
     bell["params1"] = mask_shift_set(bell["params1"], 0xFF, 0, itemid)
 
 
-# functions, that patch the object, they take: the bzs of that layer, the item id and optionally an id, then patches the object in place
+# functions, that patch the object, they take: the index of the bzs, the layer, the item id and optionally an id, then patches the object in place
 RANDO_PATCH_FUNCS = {
     "chest": rando_patch_chest,
     "HeartCo": rando_patch_heartco,
@@ -1385,40 +1467,43 @@ def get_patches_from_location_item_list(all_checks, filled_checks, chest_dowsing
 
 
 def get_entry_from_bzs(
-    bzs: OrderedDict, objdef: dict, remove: bool = False
+    index: BzsIndex, objdef: dict, remove: bool = False
 ) -> Optional[OrderedDict]:
     id = objdef.get("id", None)
-    index = objdef.get("index", None)
+    position = objdef.get("index", None)
     layer = objdef.get("layer", None)
     objtype = objdef["objtype"].ljust(
         4
     )  # OBJ has an whitespace but thats was too error prone for the yaml, so just pad it here
-    if layer is None:
-        objlist = bzs[objtype]
-    else:
-        objlist = bzs["LAY "][f"l{layer}"][objtype]
     if not id is None:
-        objs = [x for x in objlist if x["id"] == id]
+        objs = index.with_id(layer, objtype, id)
         if len(objs) != 1:
             print(f"Error finding object: {json.dumps(objdef)}")
             return None
         obj = objs[0]
-        if remove:
-            objlist.remove(obj)
-    elif not index is None:
-        if index >= len(objlist):
+    elif not position is None:
+        objlist = index.get_list(layer, objtype)
+        if position >= len(objlist):
             print(f"Error lisError list index out of range: {json.dumps(objdef)}")
             return None
-        if remove:
-            obj = objlist.pop(index)
-        else:
-            obj = objlist[index]
+        obj = objlist[position]
     else:
         print(f"ERROR: neither id nor index given for object {json.dumps(objdef)}")
         return None
+    if remove:
+        index.remove(layer, objtype, obj)
     return obj
 
 
+# GamePatcher methods used as patch functions, with the puzzle they read
+PUZZLE_PATCH_FUNCS = {
+    "patch_sandship_puzzle": "sandship",
+    "patch_ancient_cistern_puzzle": "cistern",
+    "patch_ancient_cistern_puzzle_hands": "cistern",
+    "patch_lmf_switches_puzzle": "lmf",
+}
+
+
 class GamePatcher:
     def __init__(
         self,
@@ -1455,9 +1540,24 @@ class GamePatcher:
                 "selected-loftwing-model-pack"
             ],
             copy_unmodified=False,
+            processes=self.options["patch-processes"],
+            patch_cache_path=(
+                exe_root_path / "patch-cache" if self.options["patch-cache"] else None
+            ),
+            patch_cache_size=self.options["patch-cache-size"] * 1024 * 1024,
         )
         self.text_labels = {}
 
+    def __getstate__(self):
+        # shipped to the patching processes, which report progress through the AllPatcher
+        state = self.__dict__.copy()
+        del state["progress_callback"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.progress_callback = lambda action: None
+
     def do_all_gamepatches(self):
         self.load_base_patches()
         self.add_entrance_rando_patches()
@@ -1486,6 +1586,8 @@ class GamePatcher:
         self.patcher.set_room_brres_patch(self.room_brres_patch_func)
         self.patcher.set_event_patch(self.flow_patch)
         self.patcher.set_event_text_patch(self.text_patch)
+        self.patcher.set_stage_patch_key(self.stage_patch_key)
+        self.patcher.set_event_patch_key(self.event_patch_key)
         self.patcher.progress_callback = self.progress_callback
         self.patcher.objpackoarcadd = self.patches["global"].get("objpackoarcadd", [])
         self.patcher.do_patch()
@@ -1511,6 +1613,51 @@ class GamePatcher:
             )
         )
 
+    def stage_patch_key(self, stage):
+        stagepatches = list(
+            filter(self.filter_option_requirement, self.patches.get(stage, []))
+        )
+        rando_stagepatches = [
+            (room, patches)
+            for (patch_stage, room), patches in self.rando_stagepatches.items()
+            if patch_stage == stage
+        ]
+
+        def default(value):
+            if callable(value) and (key := self.patch_func_key(value)) is not None:
+                return key
+            raise TypeError(f"{value!r} can't be part of a patch cache key")
+
+        try:
+            return json.dumps([stagepatches, rando_stagepatches], default=default)
+        except TypeError:
+            return None
+
+    def event_patch_key(self, filenames):
+        key = [
+            (
+                list(
+                    filter(
+                        self.filter_option_requirement,
+                        self.eventpatches.get(filename, []),
+                    )
+                ),
+                self.rando_eventpatches.get(filename, []),
+            )
+            for filename in filenames
+        ]
+        try:
+            return json.dumps(key)
+        except TypeError:
+            return None
+
+    def patch_func_key(self, func):
+        """What a patch function depends on, or None if it can't be keyed in the patch cache"""
+        if getattr(func, "__self__", None) is self:
+            if (puzzle := PUZZLE_PATCH_FUNCS.get(func.__name__)) is not None:
+                return [func.__name__, self.placement_file.puzzles[puzzle]]
+        return None
+
     def add_patch_to_stage(self, stage, stagepatch):
         if stage not in self.patches:
             self.patches[stage] = []
@@ -2523,8 +2670,13 @@ class GamePatcher:
                 elif patch["type"] == "oarcdelete":
                     remove_stageoarcs[(stage, patch["layer"])].add(patch["oarc"])
                 elif patch["type"] == "oarcpatch":
+                    key = self.patch_func_key(patch["func"])
                     self.patcher.patch_stage_oarc(
-                        stage, patch["layer"], patch["oarc"], patch["func"]
+                        stage,
+                        patch["layer"],
+                        patch["oarc"],
+                        patch["func"],
+                        key=None if key is None else json.dumps(key),
                     )
 
         for (stage, layer), oarcs in self.stageoarcs.items():
@@ -3080,7 +3232,7 @@ class GamePatcher:
                 ]
                 bzs["LYSE"] = layer_override
                 modified = True
-        next_id = highest_objid(bzs) + 1
+        index = BzsIndex(bzs)
         for pathadd in filter(
             lambda x: x["type"] == "pathadd" and x.get("room", None) == room,
             stagepatches,
@@ -3122,11 +3274,7 @@ class GamePatcher:
                 continue
             if "index" in obj:
                 # check index, just to verify index based lists don't have a mistake in them
-                if layer is None:
-                    objlist = bzs.get(objtype, [])
-                else:
-                    objlist = bzs["LAY "][f"l{layer}"].get(objtype, [])
-                if len(objlist) != obj["index"]:
+                if len(index.get_list(layer, objtype)) != obj["index"]:
                     print(f"ERROR: wrong index adding object: {json.dumps(objadd)}")
                     continue
             for key, val in obj.items():
@@ -3135,22 +3283,13 @@ class GamePatcher:
                 else:
                     try_patch_obj(new_obj, key, val)
             if "id" in new_obj:
-                new_obj["id"] = (new_obj["id"] & ~0x3FF) | next_id
-                next_id += 1
+                new_obj["id"] = (new_obj["id"] & ~0x3FF) | index.next_id()
             # Prevent ammo pots getting ids that collide with viewclip indexes
             if new_obj.get("name") == "Tubo":
                 id = new_obj.get("id", -1)
 
                 if id != -1 and id < 0xF000:
                     new_obj["id"] = id | 0xF000
-            if layer is None:
-                if not objtype in bzs:
-                    bzs[objtype] = []
-                objlist = bzs[objtype]
-            else:
-                if not objtype in bzs["LAY "][f"l{layer}"]:
-                    bzs["LAY "][f"l{layer}"][objtype] = []
-                objlist = bzs["LAY "][f"l{layer}"][objtype]
             # add object name to objn if it's some kind of actor
             if objtype in [
                 "SOBS",
@@ -3168,15 +3307,19 @@ class GamePatcher:
                 objn = bzs["LAY "][f"l{layer}"]["OBJN"]
                 if not obj["name"] in objn:
                     objn.append(obj["name"])
-            objlist.append(new_obj)
+            index.add(layer, objtype, new_obj)
             modified = True
             # print(obj)
         for objpatch in filter(
             lambda x: x["type"] == "objpatch" and x.get("room", None) == room,
             stagepatches,
         ):
-            obj = get_entry_from_bzs(bzs, objpatch)
+            obj = get_entry_from_bzs(index, objpatch)
             if not obj is None:
+                if not objpatch["object"].keys().isdisjoint(("id", "name")):
+                    index.invalidate(
+                        objpatch.get("layer", None), objpatch["objtype"].ljust(4)
+                    )
                 for key, val in objpatch["object"].items():
                     if key in obj:
                         obj[key] = val
@@ -3189,16 +3332,13 @@ class GamePatcher:
             lambda x: x["type"] == "objmove" and x.get("room", None) == room,
             stagepatches,
         ):
-            obj = get_entry_from_bzs(bzs, objmove, remove=True)
+            obj = get_entry_from_bzs(index, objmove, remove=True)
             destlayer = objmove["destlayer"]
             if not obj is None:
                 layer = objmove["layer"]
                 objtype = objmove["objtype"].ljust(4)
-                obj["id"] = (obj["id"] & ~0x3FF) | next_id
-                next_id += 1
-                if not objtype in bzs["LAY "][f"l{destlayer}"]:
-                    bzs["LAY "][f"l{destlayer}"][objtype] = []
-                bzs["LAY "][f"l{destlayer}"][objtype].append(obj)
+                obj["id"] = (obj["id"] & ~0x3FF) | index.next_id()
+                index.add(destlayer, objtype, obj)
                 objn = bzs["LAY "][f"l{destlayer}"]["OBJN"]
                 if not obj["name"] in objn:
                     objn.append(obj["name"])
@@ -3209,7 +3349,7 @@ class GamePatcher:
             lambda x: x["type"] == "objdelete" and x.get("room", None) == room,
             stagepatches,
         ):
-            obj = get_entry_from_bzs(bzs, objdelete, remove=True)
+            obj = get_entry_from_bzs(index, objdelete, remove=True)
             if not obj is None:
                 modified = True
                 # print(f'removed object from {layer} in room {room} with id {objdelete["id"]:04X}')
@@ -3236,11 +3376,9 @@ class GamePatcher:
         ):
             modified = True
             if objname == "Tbox" or objname == "TBox":
-                RANDO_PATCH_FUNCS[objname](
-                    bzs["LAY "][f"l{layer}"], itemid, objid, dowsing
-                )
+                RANDO_PATCH_FUNCS[objname](index, layer, itemid, objid, dowsing)
             else:
-                RANDO_PATCH_FUNCS[objname](bzs["LAY "][f"l{layer}"], itemid, objid)
+                RANDO_PATCH_FUNCS[objname](index, layer, itemid, objid)
 
         if modified:
             # print(json.dumps(bzs))
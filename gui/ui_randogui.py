@@ -161,6 +161,11 @@ class Ui_MainWindow(object):
 
         self.vlay_advanced.addWidget(self.option_dry_run)
 
+        self.option_patch_cache = QCheckBox(self.box_advanced)
+        self.option_patch_cache.setObjectName(u"option_patch_cache")
+
+        self.vlay_advanced.addWidget(self.option_patch_cache)
+
         self.vspace_advanced = QSpacerItem(20, 40, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
 
         self.vlay_advanced.addItem(self.vspace_advanced)
@@ -1989,6 +1994,7 @@ class Ui_MainWindow(object):
         self.option_out_placement_file.setText(QCoreApplication.translate("MainWindow", u"Generate Placement File", None))
         self.box_advanced.setTitle(QCoreApplication.translate("MainWindow", u"Advanced Options", None))
         self.option_dry_run.setText(QCoreApplication.translate("MainWindow", u"Dry Run", None))
+        self.option_patch_cache.setText(QCoreApplication.translate("MainWindow", u"Patch Cache", None))
         self.box_cosmetics.setTitle(QCoreApplication.translate("MainWindow", u"Cosmetics", None))
         self.option_cryptic_location_hints.setText(QCoreApplication.translate("MainWindow", u"Cryptic Location Hints", None))
         self.option_lightning_skyward_strike.setText(QCoreApplication.translate("MainWindow", u"Lightning Skyward Strike", None))
@@ -0,0 +1,108 @@
+"""
+Cache of the fully built Areas.
+
+Building the Areas means parsing every requirement with lark and lowering it to
+DNFInventory objects, which dominates startup. The result is pickled together
+with the extended item list and the module state of logic_input, and keyed by
+the content of every file it was built from, so that any change to the logic
+triggers a rebuild.
+"""
+
+from __future__ import annotations
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+from paths import AREAS_CACHE_PATH, IS_RUNNING_FROM_SOURCE, RANDO_ROOT_PATH
+from version import VERSION
+from . import logic_input
+from .inventory import EXTENDED_ITEM
+from .logic_input import Areas
+
+# Bump this when the layout of the cache changes
+AREAS_CACHE_VERSION = 1
+AREAS_CACHE_MAGIC = b"SSRAREAS"
+
+
+def areas_cache_sources():
+    requirements_folder = RANDO_ROOT_PATH / "logic" / "requirements"
+    yield from sorted(requirements_folder.glob("*.yaml"))
+    for filename in ("checks.yaml", "hints.yaml", "entrances.yaml", "options.yaml"):
+        yield RANDO_ROOT_PATH / filename
+    # The code that builds the areas and the constants it uses, when running from source
+    yield from sorted(Path(__file__).parent.glob("*.py"))
+    if IS_RUNNING_FROM_SOURCE:
+        # The modules outside of logic it imports, yaml_files parses the requirements
+        for filename in ("yaml_files.py", "paths.py"):
+            yield RANDO_ROOT_PATH / filename
+
+
+def areas_cache_key() -> bytes:
+    key = hashlib.sha256()
+    key.update(f"{AREAS_CACHE_VERSION} {VERSION}".encode())
+    for path in areas_cache_sources():
+        key.update(path.name.encode())
+        key.update(hashlib.sha256(path.read_bytes()).digest())
+    return key.digest()
+
+
+def save_areas(areas: Areas, key: bytes, path: Path = AREAS_CACHE_PATH):
+    state = (
+        areas,
+        EXTENDED_ITEM.items_list,
+        logic_input.events,
+        logic_input.areas_list,
+        logic_input.map_exit_suffixes,
+    )
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(AREAS_CACHE_MAGIC)
+        f.write(key)
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def read_areas(key: bytes, path: Path = AREAS_CACHE_PATH) -> Areas | None:
+    try:
+        with path.open("rb") as f:
+            if f.read(len(AREAS_CACHE_MAGIC)) != AREAS_CACHE_MAGIC:
+                return None
+            if f.read(len(key)) != key:
+                return None
+            areas, items_list, events, areas_list, map_exit_suffixes = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring invalid areas cache: {e!r}")
+        return None
+
+    assert not EXTENDED_ITEM.complete
+    if items_list[: len(EXTENDED_ITEM.items_list)] != EXTENDED_ITEM.items_list:
+        return None
+    EXTENDED_ITEM.items_list[:] = items_list
+    EXTENDED_ITEM.freeze()
+    logic_input.events[:] = events
+    logic_input.areas_list[:] = areas_list
+    logic_input.map_exit_suffixes = map_exit_suffixes
+    return areas
+
+
+def load_areas(path: Path = AREAS_CACHE_PATH) -> Areas:
+    """Loads the areas from the cache, rebuilding it if it is missing or outdated."""
+    key = areas_cache_key()
+    if (areas := read_areas(key, path)) is not None:
+        return areas
+
+    from yaml_files import requirements, checks, hints, map_exits
+
+    areas = Areas(requirements, checks, hints, map_exits)
+    try:
+        save_areas(areas, key, path)
+    except OSError as e:
+        print(f"Could not write the areas cache: {e!r}")
+    return areas
+
+
+if __name__ == "__main__":
+    load_areas()
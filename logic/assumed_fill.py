@@ -17,7 +17,9 @@ class AssumedFill:
         self.rng = rng
         self.randosettings = randosettings
 
-        full_inventory = Logic.get_everything_unbanned(self.logic.requirements)
+        full_inventory = Logic.get_everything_unbanned(
+            self.logic.requirements, self.logic.backup_requirements
+        )
         truly_progress_item = Logic.aggregate_requirements(
             self.logic.requirements, full_inventory, EVERYTHING_UNBANNED_BIT
         )
@@ -74,9 +76,7 @@ class AssumedFill:
         self.rng.shuffle(self.may_be_placed_items)
 
         self.logic.add_item(BANNED_BIT)
-        for item in self.must_be_placed_items:
-            self.useroutput.progress_callback("placing nonprogress items...")
-            assert self.place_item(item)
+        self.place_nonprogress_items(self.must_be_placed_items)
         self.useroutput.progress_callback("placing remaining items...")
 
         unplaced = set()
@@ -91,30 +91,56 @@ class AssumedFill:
         self.fill_with_junk(self.randosettings.duplicable_items)
 
     def fill_with_junk(self, junk):
-        empty_locations = [
-            loc
-            for loc in self.logic.accessible_checks()
-            if loc not in self.logic.placement.locations
-        ]
+        empty_locations = self.logic.accessible_empty_checks()
         junk = list(junk)
 
         for location in empty_locations:
             result = self.logic.place_item(location, self.rng.choice(junk), fill=False)
             assert result
 
+    def place_nonprogress_items(self, items: List[EIN]):
+        """
+        Places items without filling the inventory after each of them, as long
+        as they cannot change the accessible checks, with a single fill at the
+        end. Items that can, or that find no empty location, go through
+        place_item after the pending fill.
+        """
+        pending = False
+        for item in items:
+            self.useroutput.progress_callback("placing nonprogress items...")
+            if (
+                item not in EXTENDED_ITEM
+                or not self.logic.aggregate[EXTENDED_ITEM[item]]
+            ):
+                if item in EXTENDED_ITEM:
+                    self.logic.remove_item(EXTENDED_ITEM[item])
+                placement_limit: EIN = self.logic.placement.item_placement_limit.get(
+                    item, EIN("")
+                )
+                if empty_locations := self.logic.accessible_empty_checks(
+                    placement_limit
+                ):
+                    location = self.rng.choice(empty_locations)
+                    result = self.logic.place_item(location, item, fill=False)
+                    assert result
+                    pending = True
+                    continue
+
+            if pending:
+                self.logic.fill_inventory_i(monotonic=True)
+                pending = False
+            assert self.place_item(item)
+
+        if pending:
+            self.logic.fill_inventory_i(monotonic=True)
+
     def place_item(self, item: EXTENDED_ITEM_NAME, depth=0, force=True) -> bool:
         if item in EXTENDED_ITEM:
             self.logic.remove_item(EXTENDED_ITEM[item])
         placement_limit: EIN = self.logic.placement.item_placement_limit.get(
             item, EIN("")
         )
-        accessible_locations = self.logic.accessible_checks(placement_limit)
-
-        empty_locations = [
-            loc
-            for loc in accessible_locations
-            if loc not in self.logic.placement.locations
-        ]
+        empty_locations = self.logic.accessible_empty_checks(placement_limit)
 
         if empty_locations:
             location = self.rng.choice(empty_locations)
@@ -125,6 +151,7 @@ class AssumedFill:
         # We have to replace an already placed item
         if not force or depth > 50:
             return False
+        accessible_locations = self.logic.accessible_checks(placement_limit)
         if not accessible_locations:
             raise self.useroutput.GenerationFailed(
                 f"No more locations accessible for {item}."
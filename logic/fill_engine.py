@@ -0,0 +1,319 @@
+from __future__ import annotations
+from typing import Iterable, List, Set, Tuple
+import weakref
+
+from .logic_expression import DNFInventory, ThresholdDNFInventory
+from .inventory import EXTENDED_ITEM, Inventory
+
+
+def iter_bits(bitset: int):
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class RequirementTable:
+    """
+    Requirements lowered to plain integers: for every requirement index, the
+    tuple of the bitmasks of its conjunctions. Threshold requirements have no
+    conjunction but a (group bitmask, quantity) pair instead.
+
+    A reverse index maps every bit to the requirements that mention it.
+    The table follows a requirements list by identity: any requirement that
+    has been reassigned since the previous sync is recompiled, and its index
+    is appended to the change log so that several engines can share a table.
+    The log is trimmed to the oldest position of the engines still alive.
+    """
+
+    def __init__(self, requirements: List[DNFInventory] | None = None):
+        self.sources: List[DNFInventory | None] = []
+        self.masks: List[Tuple[int, ...]] = []
+        self.thresholds: List[Tuple[int, int] | None] = []
+        self.dependents: List[Set[int]] = []
+        self.bit_lists: List[Tuple[Tuple[int, ...], ...] | None] = []
+        self.log: List[int] = []
+        # position of log[0] since the creation of the table
+        self.log_start = 0
+        self.engines = weakref.WeakSet()
+        if requirements is not None:
+            self.sync(requirements)
+
+    def __len__(self):
+        return len(self.sources)
+
+    def sync(self, requirements: List[DNFInventory]):
+        sources = self.sources
+        if len(sources) < len(requirements):
+            missing = len(requirements) - len(sources)
+            sources.extend([None] * missing)
+            self.masks.extend([()] * missing)
+            self.thresholds.extend([None] * missing)
+            self.bit_lists.extend([None] * missing)
+            self.dependents.extend(set() for _ in range(missing))
+
+        changed = [
+            i
+            for i, (req, source) in enumerate(zip(requirements, sources))
+            if req is not source
+        ]
+
+        dependents = self.dependents
+        for i in changed:
+            for bit in iter_bits(self.mentioned(i)):
+                dependents[bit].discard(i)
+
+            new = requirements[i]
+            if isinstance(new, ThresholdDNFInventory):
+                self.masks[i] = ()
+                self.thresholds[i] = (new.group.bitset, new.quantity)
+            else:
+                self.masks[i] = tuple(conj.bitset for conj in new.disjunction)
+                self.thresholds[i] = None
+            for bit in iter_bits(self.mentioned(i)):
+                dependents[bit].add(i)
+            self.bit_lists[i] = None
+            sources[i] = new
+
+        self.log.extend(changed)
+
+    def copy(self) -> RequirementTable:
+        """A table compiled from the same requirements, with an empty log and no engines"""
+        table = RequirementTable()
+        table.sources = self.sources.copy()
+        table.masks = self.masks.copy()
+        table.thresholds = self.thresholds.copy()
+        table.dependents = [dependents.copy() for dependents in self.dependents]
+        table.bit_lists = self.bit_lists.copy()
+        return table
+
+    def register(self, engine: FillEngine) -> int:
+        """Returns the current position in the log"""
+        self.engines.add(engine)
+        return self.log_start + len(self.log)
+
+    def changes(self, position: int) -> Tuple[List[int], int]:
+        """The indices logged since a position, and the current position"""
+        return self.log[position - self.log_start :], self.log_start + len(self.log)
+
+    def trim(self):
+        oldest = min(
+            (engine.position for engine in self.engines),
+            default=self.log_start + len(self.log),
+        )
+        del self.log[: oldest - self.log_start]
+        self.log_start = oldest
+
+    def mentioned(self, index: int) -> int:
+        mentioned = 0
+        for conj_bits in self.masks[index]:
+            mentioned |= conj_bits
+        if (threshold := self.thresholds[index]) is not None:
+            mentioned |= threshold[0]
+        return mentioned
+
+    def threshold_support(self, index: int, bits: int) -> int | None:
+        """The bits of the group of a threshold requirement, if there are enough of them."""
+        if (threshold := self.thresholds[index]) is not None:
+            group, quantity = threshold
+            if (support := group & bits).bit_count() >= quantity:
+                return support
+        return None
+
+    def get_bit_lists(self, index: int) -> Tuple[Tuple[int, ...], ...]:
+        """The bits of every conjunction of a requirement, computed on demand."""
+        if (bit_lists := self.bit_lists[index]) is None:
+            bit_lists = tuple(tuple(iter_bits(mask)) for mask in self.masks[index])
+            self.bit_lists[index] = bit_lists
+        return bit_lists
+
+
+class FillEngine:
+    """
+    Computes the fixpoint of a list of requirements with a worklist.
+
+    The requirements are evaluated through a RequirementTable, so that only
+    the requirements whose inputs just changed are re-evaluated. Any
+    requirement recompiled since the previous fill is re-evaluated.
+
+    Every derived bit remembers the conjunction that justified it (its support),
+    bits without support are the axioms the fixpoint was started from.
+    Successive fills resume from the previous fixpoint: bits whose support is
+    lost are retracted, and only them and their dependents are re-derived.
+    """
+
+    def __init__(self, table: RequirementTable | None = None):
+        if table is None:
+            table = RequirementTable()
+        self.table = table
+        self.position = table.register(self)
+        self.support: List[int | None] = []
+        self.axioms = 0
+        self.inventory: Inventory | None = None
+
+    def sync(self, requirements: List[DNFInventory]) -> Iterable[int]:
+        """Returns the indices of the requirements changed since the previous fill."""
+        table = self.table
+        table.sync(requirements)
+        if len(self.support) < len(table):
+            self.support.extend([None] * (len(table) - len(self.support)))
+        changes, self.position = table.changes(self.position)
+        table.trim()
+        return dict.fromkeys(changes)
+
+    def fill(self, requirements: List[DNFInventory], inventory: Inventory):
+        changed = self.sync(requirements)
+        if self.inventory is None:
+            return self.reset(inventory)
+
+        support = self.support
+        masks = self.table.masks
+        dependents = self.table.dependents
+        given = inventory.bitset
+        bits = self.inventory.bitset
+        axioms = self.axioms & given
+        retracted = []
+
+        def retract(bit):
+            nonlocal bits, axioms
+            support[bit] = None
+            if given >> bit & 1:
+                # Still given, it only loses its support
+                axioms |= 1 << bit
+            else:
+                bits &= ~(1 << bit)
+                retracted.append(bit)
+
+        # A requirement that changed must still justify the bit it derived
+        for i in changed:
+            if bits >> i & 1 and (old_support := support[i]) is not None:
+                for conj_bits in masks[i]:
+                    if conj_bits & old_support == conj_bits:
+                        support[i] = conj_bits
+                        break
+                else:
+                    if (
+                        conj_bits := self.table.threshold_support(i, old_support)
+                    ) is not None:
+                        support[i] = conj_bits
+                    else:
+                        retract(i)
+
+        for bit in iter_bits(self.axioms & ~given & bits):
+            retract(bit)
+
+        # Retract everything whose support depends on a retracted bit
+        index = 0
+        while index < len(retracted):
+            bit = retracted[index]
+            index += 1
+            for dep in dependents[bit]:
+                if bits >> dep & 1 and (dep_support := support[dep]) is not None:
+                    if dep_support >> bit & 1:
+                        retract(dep)
+
+        todo = retracted + list(changed)
+        new_axioms = given & ~bits
+        for bit in iter_bits(new_axioms):
+            todo.extend(dependents[bit])
+        bits |= new_axioms
+        self.axioms = axioms | new_axioms
+
+        return self.propagate(bits, todo)
+
+    def reset(self, inventory: Inventory):
+        self.support = [None] * len(self.table)
+        self.axioms = inventory.bitset
+        return self.propagate(inventory.bitset, range(len(self.table)))
+
+    def propagate(self, bits: int, todo: Iterable[int]) -> Inventory:
+        support = self.support
+        masks = self.table.masks
+        thresholds = self.table.thresholds
+        dependents = self.table.dependents
+        todo = [i for i in todo if not bits >> i & 1]
+        while todo:
+            i = todo.pop()
+            if bits >> i & 1:
+                continue
+            for conj_bits in masks[i]:
+                if conj_bits & bits == conj_bits:
+                    break
+            else:
+                if (threshold := thresholds[i]) is None:
+                    continue
+                group, quantity = threshold
+                # A threshold is supported by all the bits of its group it has
+                if (conj_bits := group & bits).bit_count() < quantity:
+                    continue
+            bits |= 1 << i
+            support[i] = conj_bits
+            todo.extend(j for j in dependents[i] if not bits >> j & 1)
+
+        self.inventory = Inventory.of_bitset(bits)
+        return self.inventory
+
+
+def batch_fill(
+    table: RequirementTable,
+    inventories: List[Inventory],
+    banned: List[int] | None = None,
+) -> List[Inventory]:
+    """
+    Computes the fixpoints of several inventories at once.
+
+    Inventory [k] is filled as if the requirement of every bit of [banned[k]]
+    was impossible. The inventories are bit-sliced: for every bit, a single
+    integer holds the value of that bit in each inventory, so that a single
+    worklist pass evaluates every requirement for all the inventories together.
+    """
+    nb_bits = len(table)
+    if banned is None:
+        banned = [0] * len(inventories)
+
+    columns = [0] * nb_bits
+    allowed = [(1 << len(inventories)) - 1] * nb_bits
+    for k, (inventory, banned_bits) in enumerate(zip(inventories, banned)):
+        lane = 1 << k
+        for bit in iter_bits(inventory.bitset):
+            columns[bit] |= lane
+        for bit in iter_bits(banned_bits):
+            allowed[bit] &= ~lane
+
+    dependents = table.dependents
+    thresholds = table.thresholds
+    get_bit_lists = table.get_bit_lists
+    todo = list(range(nb_bits))
+    while todo:
+        i = todo.pop()
+        missing = allowed[i] & ~columns[i]
+        if not missing:
+            continue
+        satisfied = 0
+        for bit_list in get_bit_lists(i):
+            lanes = missing
+            for bit in bit_list:
+                lanes &= columns[bit]
+                if not lanes:
+                    break
+            satisfied |= lanes
+            if satisfied == missing:
+                break
+        if satisfied != missing and (threshold := thresholds[i]) is not None:
+            group, quantity = threshold
+            # at_least[j] holds the lanes with at least j items of the group
+            at_least = [missing] + [0] * quantity
+            for bit in iter_bits(group):
+                column = columns[bit]
+                for j in range(quantity, 0, -1):
+                    at_least[j] |= at_least[j - 1] & column
+            satisfied |= at_least[quantity]
+        if satisfied:
+            columns[i] |= satisfied
+            todo.extend(dependents[i])
+
+    bitsets = [0] * len(inventories)
+    for bit, column in enumerate(columns):
+        for k in iter_bits(column):
+            bitsets[k] |= 1 << bit
+    return [Inventory.of_bitset(bitset) for bitset in bitsets]
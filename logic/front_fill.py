@@ -17,7 +17,9 @@ class FrontFill:
         self.rng = rng
         self.randosettings = randosettings
 
-        full_inventory = Logic.get_everything_unbanned(self.logic.requirements)
+        full_inventory = Logic.get_everything_unbanned(
+            self.logic.requirements, self.logic.backup_requirements
+        )
         truly_progress_item = Logic.aggregate_requirements(
             self.logic.requirements, full_inventory, EVERYTHING_UNBANNED_BIT
         )
@@ -127,13 +129,7 @@ class FrontFill:
 
     def place_dungeon_item(self, item_name):
         placement_limit = self.logic.placement.item_placement_limit[item_name]
-        accessible_locations = self.logic.accessible_checks(placement_limit)
-
-        empty_locations = [
-            loc
-            for loc in accessible_locations
-            if loc not in self.logic.placement.locations
-        ]
+        empty_locations = self.logic.accessible_empty_checks(placement_limit)
 
         if empty_locations:
             location = self.rng.choice(empty_locations)
@@ -146,11 +142,7 @@ class FrontFill:
         )
 
     def randomize_progression_items(self):
-        accessible_undone_locations = [
-            loc
-            for loc in self.logic.accessible_checks()
-            if loc not in self.logic.placement.locations
-        ]
+        accessible_undone_locations = self.logic.accessible_empty_checks()
         if len(accessible_undone_locations) == 0:
             raise Exception(
                 "No progress locations are accessible at the very start of the game."
@@ -162,11 +154,7 @@ class FrontFill:
         location_weights = {}
         current_weight = 1
         while unplaced_progress_items:
-            accessible_undone_locations = [
-                loc
-                for loc in self.logic.accessible_checks()
-                if loc not in self.logic.placement.locations
-            ]
+            accessible_undone_locations = self.logic.accessible_empty_checks()
 
             if not accessible_undone_locations:
                 raise Exception("No locations left to place progress items.")
@@ -269,11 +257,7 @@ class FrontFill:
         # Place unique non-progress items.
         to_place = list(self.must_be_placed_items)
         while to_place:
-            accessible_undone_locations = [
-                loc
-                for loc in self.logic.accessible_checks()
-                if loc not in self.logic.placement.locations
-            ]
+            accessible_undone_locations = self.logic.accessible_empty_checks()
 
             item_name = self.rng.choice(to_place)
 
@@ -291,11 +275,7 @@ class FrontFill:
             self.logic.placement.item_placement_limit[item_name] == EIN("")
             for item_name in self.may_be_placed_items
         )
-        empty_locations = [
-            loc
-            for loc in self.logic.accessible_checks()
-            if loc not in self.logic.placement.locations
-        ]
+        empty_locations = self.logic.accessible_empty_checks()
 
         to_place = list(self.may_be_placed_items)
         self.rng.shuffle(to_place)
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Set, List, Tuple
+from typing import Dict, Set, List, Tuple
 
 from yaml_files import options
 from .constants import *
@@ -32,15 +32,38 @@ class MetaContainer(type):
     def __iter__(self):
         return self.iter()  # type: ignore
 
+    def __contains__(self, arg):
+        return self.contains(arg)  # type: ignore
+
 
 class EXTENDED_ITEM(int, metaclass=MetaContainer):
     items_list: List[EXTENDED_ITEM_NAME] = list(extended_item_generator())  # type: ignore
     complete = False
+    # Name to bit registry, and the interned bits, indexed as items_list grows
+    items_index: Dict[EXTENDED_ITEM_NAME, EXTENDED_ITEM] = {}
+    bits: List[EXTENDED_ITEM] = []
+
+    @classmethod
+    def index_new_items(cls):
+        bits = cls.bits
+        items_index = cls.items_index
+        for i in range(len(bits), len(cls.items_list)):
+            bit = cls(i)
+            bits.append(bit)
+            # Like list.index, a name refers to its first occurrence
+            items_index.setdefault(cls.items_list[i], bit)
+
+    @classmethod
+    def freeze(cls):
+        """Called once the items list is complete, no item can be added afterwards"""
+        cls.index_new_items()
+        cls.complete = True
 
     @classmethod
     def items(cls):
-        for i in range(len(cls)):
-            yield cls(i)
+        if not cls.complete:
+            cls.index_new_items()
+        return iter(cls.bits)
 
     @classmethod
     def len(cls):
@@ -50,9 +73,22 @@ class EXTENDED_ITEM(int, metaclass=MetaContainer):
     def iter(cls):
         return iter(cls.items_list)
 
+    @classmethod
+    def contains(cls, name: EXTENDED_ITEM_NAME) -> bool:
+        if name not in cls.items_index and not cls.complete:
+            cls.index_new_items()
+        return name in cls.items_index
+
     @classmethod
     def getitem(cls, name: EXTENDED_ITEM_NAME) -> EXTENDED_ITEM:
-        return cls(cls.items_list.index(name))
+        try:
+            return cls.items_index[name]
+        except KeyError:
+            if not cls.complete:
+                cls.index_new_items()
+                if (bit := cls.items_index.get(name)) is not None:
+                    return bit
+            raise ValueError(f"{name!r} is not in list") from None
 
     @classmethod
     def get_item_name(cls, i: EXTENDED_ITEM) -> EXTENDED_ITEM_NAME:
@@ -66,14 +102,20 @@ class EXTENDED_ITEM(int, metaclass=MetaContainer):
 
 
 class Inventory:
+    """
+    A set of items, stored as a single bitset.
+
+    Inventories are immutable, the items are only enumerated on demand, by
+    scanning the bitset.
+    """
+
+    __slots__ = ("bitset",)
     bitset: int
-    intset: Set[EXTENDED_ITEM]
 
     def __init__(
         self,
         v: (
             None
-            | Tuple[int, Set[EXTENDED_ITEM]]
             | Tuple[str, int]
             | EXTENDED_ITEM_NAME
             | Set[EXTENDED_ITEM]
@@ -83,77 +125,71 @@ class Inventory:
     ):
         if v is None:
             self.bitset = 0
-            self.intset = set()
         elif isinstance(v, Inventory):
             self.bitset = v.bitset
-            self.intset = v.intset
         elif isinstance(v, set):
             bitset = 0
             for item in v:
-                bitset += 1 << item
-            self.intset = v
+                bitset |= 1 << item
             self.bitset = bitset
         elif isinstance(v, EXTENDED_ITEM):
             self.bitset = 1 << v
-            self.intset = {v}
         elif isinstance(v, str):
-            bit = EXTENDED_ITEM[v]
-            self.bitset = 1 << bit
-            self.intset = {bit}
+            self.bitset = 1 << EXTENDED_ITEM[v]
         elif isinstance(v, tuple):  # Item, count
             item, count = v
-            if isinstance(item, int):  # bitset, intset
-                assert isinstance(count, set)
-                self.bitset = item
-                self.intset = count
+            assert isinstance(count, int)
+            assert count <= ITEM_COUNTS[item]
+            if ITEM_COUNTS[item] == 1:
+                self.bitset = 1 << EXTENDED_ITEM[item]
             else:
-                assert isinstance(count, int)
-                assert count <= ITEM_COUNTS[item]
-                if ITEM_COUNTS[item] == 1:
-                    bit = EXTENDED_ITEM[item]
-                    self.bitset = 1 << bit
-                    self.intset = {bit}
-                else:
-                    self.bitset = 0
-                    self.intset = set()
-                    for i in range(count):
-                        bit = EXTENDED_ITEM[number(item, i)]
-                        self.bitset |= 1 << bit
-                        self.intset.add(bit)
+                self.bitset = 0
+                for i in range(count):
+                    self.bitset |= 1 << EXTENDED_ITEM[number(item, i)]
         else:
             raise ValueError
 
+    @staticmethod
+    def of_bitset(bitset: int) -> Inventory:
+        inventory = object.__new__(Inventory)
+        inventory.bitset = bitset
+        return inventory
+
+    @property
+    def intset(self) -> Set[EXTENDED_ITEM]:
+        return set(self)
+
     def __getitem__(self, index):
         if isinstance(index, EXTENDED_ITEM):
-            return bool(self.bitset & (1 << index))
+            return bool(self.bitset >> index & 1)
         else:
             raise ValueError
 
     def __or__(self, other):
         if isinstance(other, EXTENDED_ITEM):
-            return Inventory((self.bitset | (1 << other), self.intset | {other}))
+            return Inventory.of_bitset(self.bitset | (1 << other))
         elif isinstance(other, Inventory):
-            return Inventory((self.bitset | other.bitset, self.intset | other.intset))
+            return Inventory.of_bitset(self.bitset | other.bitset)
         else:
             raise ValueError
 
     def __and__(self, other):
         if isinstance(other, Inventory):
-            return Inventory((self.bitset & other.bitset, self.intset & other.intset))
+            return Inventory.of_bitset(self.bitset & other.bitset)
         else:
             raise ValueError
 
     def __sub__(self, other):
         if isinstance(other, EXTENDED_ITEM):
-            return Inventory((self.bitset & ~(1 << other), self.intset - {other}))
+            return Inventory.of_bitset(self.bitset & ~(1 << other))
         elif isinstance(other, Inventory):
-            return Inventory((self.bitset & ~other.bitset, self.intset - other.intset))
+            return Inventory.of_bitset(self.bitset & ~other.bitset)
         else:
             raise ValueError
 
     def __le__(self, other):
         """Define inclusion"""
-        return self.bitset | other.bitset == other.bitset
+        return not self.bitset & ~other.bitset
 
     def __eq__(self, other):
         return self.bitset == other.bitset
@@ -162,11 +198,23 @@ class Inventory:
         return hash(self.bitset)
 
     def __iter__(self):
-        return iter(self.intset)
+        bits = EXTENDED_ITEM.bits
+        bitset = self.bitset
+        while bitset:
+            low = bitset & -bitset
+            i = low.bit_length() - 1
+            yield bits[i] if i < len(bits) else EXTENDED_ITEM(i)
+            bitset ^= low
+
+    def count(self) -> int:
+        return self.bitset.bit_count()
 
     def __repr__(self) -> str:
         return f"Inventory({self.intset!r})"
 
+    def __reduce__(self):
+        return (Inventory.of_bitset, (self.bitset,))
+
     def add(self, item: EXTENDED_ITEM | str):
         if isinstance(item, EXTENDED_ITEM) or isinstance(item, Inventory):
             return self | item
@@ -181,33 +229,25 @@ class Inventory:
 
     def remove(self, item: EXTENDED_ITEM | str):
         if isinstance(item, EXTENDED_ITEM):
-            return Inventory(
-                (self.bitset & ~(1 << item), self.intset.difference({item}))
-            )
+            return Inventory.of_bitset(self.bitset & ~(1 << item))
         elif isinstance(item, str):
             for i in reversed(range(ITEM_COUNTS[item])):
                 if self[(item_bit := EXTENDED_ITEM[number(item, i)])]:
-                    return Inventory(
-                        (
-                            self.bitset & ~(1 << item_bit),
-                            self.intset.difference({item_bit}),
-                        )
-                    )
+                    return Inventory.of_bitset(self.bitset & ~(1 << item_bit))
             else:
                 raise ValueError(f"{item} not in inventory.")
         raise ValueError(item)
 
     @staticmethod
     def simplify_invset(argset):
-        def gen():
-            for bitset in argset:
-                for bitset2 in argset:
-                    if bitset2 <= bitset and bitset2 != bitset:
-                        break
-                else:
-                    yield bitset
-
-        return set(gen())
+        # By increasing popcount, an inventory can only be strictly included
+        # in the minimal ones already kept
+        kept = []
+        for inv in sorted(argset, key=lambda inv: inv.bitset.bit_count()):
+            bitset = inv.bitset
+            if not any(bits & bitset == bits for bits, _ in kept):
+                kept.append((bitset, inv))
+        return {inv for _, inv in kept}
 
     def all_owned_unique_items(self):
         return set(
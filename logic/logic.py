@@ -1,5 +1,4 @@
 from __future__ import annotations
-from functools import cache
 from typing import Any, Dict, Iterable, List, Set, Tuple
 from collections import defaultdict
 from dataclasses import dataclass, field
@@ -8,7 +7,8 @@ from hints.hint_types import GossipStoneHintWrapper, Hint
 
 from .constants import *
 from .logic_input import Area, Areas, DayOnly, NightOnly, Both
-from .logic_expression import DNFInventory, AndCombination
+from .logic_expression import DNFInventory, AndCombination, ThresholdDNFInventory
+from .fill_engine import FillEngine, RequirementTable
 from .inventory import (
     HINT_BYPASS_BIT,
     EVERYTHING_BIT,
@@ -149,6 +149,19 @@ class Placement:
         self.unplaced_items |= items
 
 
+@dataclass
+class CheckIndex:
+    """
+    The checks below a placement limit, in exploration order, and the mask of
+    their bits. [positions] gives the exploration rank of every bit, unless
+    the bits already come in that order.
+    """
+
+    checks: List[EIN]
+    mask: int
+    positions: Dict[int, int] | None
+
+
 @dataclass
 class LogicSettings:
     full_inventory: Inventory
@@ -159,15 +172,14 @@ class LogicSettings:
 
 class Logic:
     @staticmethod
-    def fill_inventory(requirements: List[DNFInventory], inventory: Inventory):
-        keep_going = True
-        while keep_going:
-            keep_going = False
-            for i in EXTENDED_ITEM.items():
-                if not inventory[i] and requirements[i].eval(inventory):
-                    inventory |= i
-                    keep_going = True
-        return inventory
+    def fill_inventory(
+        requirements: List[DNFInventory],
+        inventory: Inventory,
+        engine: FillEngine | None = None,
+    ):
+        if engine is None:
+            engine = FillEngine()
+        return engine.fill(requirements, inventory)
 
     @staticmethod
     def is_full_inventory(requirements: List[DNFInventory], inventory: Inventory):
@@ -182,29 +194,32 @@ class Logic:
         full_inventory: Inventory | None,
         start_bit: EXTENDED_ITEM | None = None,
     ):
-        aggregate = EMPTY_INV
+        aggregate = 0
         if full_inventory is None:
-            test = lambda _: True
+            allowed = -1
         else:
-            test = lambda bit: full_inventory[bit]
+            allowed = full_inventory.bitset
         if start_bit is None:
-            for bit in EXTENDED_ITEM.items():
-                if test(bit):
-                    for conj in requirements[bit].disjunction:
-                        aggregate |= conj
+            for bit, req in enumerate(requirements):
+                if allowed >> bit & 1:
+                    aggregate |= req.aggregate().bitset
         else:
-            todos = {start_bit}
+            todos = 1 << start_bit
             while todos:
-                bit = todos.pop()
-                if test(bit):
-                    for conj in requirements[bit].disjunction:
-                        todos |= conj.intset - aggregate.intset
-                        aggregate |= conj
+                low = todos & -todos
+                todos ^= low
+                if allowed & low:
+                    ag = requirements[low.bit_length() - 1].aggregate().bitset
+                    todos |= ag & ~aggregate
+                    aggregate |= ag
 
-        return aggregate
+        return Inventory.of_bitset(aggregate)
 
     @staticmethod
-    def get_everything_unbanned(requirements: List[DNFInventory]):
+    def get_everything_unbanned(
+        requirements: List[DNFInventory],
+        backup_requirements: List[DNFInventory] | None = None,
+    ):
         inventory = Inventory(
             {EXTENDED_ITEM[itemname] for itemname in INVENTORY_ITEMS}
             | {HINT_BYPASS_BIT}
@@ -215,34 +230,81 @@ class Logic:
             Inventory({item for item in everything_req if full_inventory[item]})
         )
         requirements[EVERYTHING_UNBANNED_BIT] = everything_unbanned_req
+        if backup_requirements is not None:
+            backup_requirements[EVERYTHING_UNBANNED_BIT] = everything_unbanned_req
         return Logic.fill_inventory(requirements, full_inventory)
 
     @staticmethod
-    def free_simplify(requirements, free: Inventory):
+    def free_simplifications(
+        requirements, free: Inventory, engine: FillEngine | None = None
+    ) -> List[int]:
+        """The requirements that the frees make trivially true, and are not yet."""
+        req = DNFInventory(True)
+        return [
+            i
+            for i in Logic.fill_inventory(requirements, free, engine) - free
+            if requirements[i].disjunction.keys() != req.disjunction.keys()
+        ]
+
+    @staticmethod
+    def free_simplify(requirements, free: Inventory, engine: FillEngine | None = None):
         req = DNFInventory(True)
-        for i in Logic.fill_inventory(requirements, free) - free:
+        for i in Logic.free_simplifications(requirements, free, engine):
             requirements[i] = req
 
+    @staticmethod
+    def simplify_threshold(requirements, opaques, req: ThresholdDNFInventory):
+        group = req.group
+        quantity = req.quantity
+        for item in req.group:
+            item_req = requirements[item]
+            if opaques[item] or isinstance(item_req, ThresholdDNFInventory):
+                continue
+            if not item_req.disjunction:
+                group = group - item
+            elif item_req.disjunction.keys() == {EMPTY_INV}:
+                group = group - item
+                quantity -= 1
+        if group == req.group:
+            return req
+        if quantity <= 0:
+            return DNFInventory(True)
+        if quantity > group.count():
+            return DNFInventory()
+        if quantity == group.count():
+            return DNFInventory(group)
+        return ThresholdDNFInventory(group, quantity)
+
     @staticmethod
     def shallow_simplify(requirements, opaques):
+        # Thresholds first, so that the ones that became trivial get inlined
+        for item, req in enumerate(requirements):
+            if isinstance(req, ThresholdDNFInventory):
+                requirements[item] = Logic.simplify_threshold(
+                    requirements, opaques, req
+                )
+
         simplifiables = Inventory(
             {
                 item
                 for item in EXTENDED_ITEM.items()
                 if not opaques[item]
+                if not isinstance(requirements[item], ThresholdDNFInventory)
                 if len(requirements[item].disjunction) <= 1
             }
         )
 
         for item, req in enumerate(requirements):
-            if item == EVERYTHING_BIT or len(req.disjunction) >= 30:
+            if item == EVERYTHING_BIT or isinstance(req, ThresholdDNFInventory):
+                continue
+            if len(req.disjunction) >= 30:
                 continue
             new_req = DNFInventory()
             for conj in req.disjunction:
                 if conj & simplifiables:
                     new_conj = Inventory()
                     skip = False
-                    for req_item in conj.intset:
+                    for req_item in conj:
                         if not simplifiables[req_item]:
                             new_conj |= Inventory(req_item)
                         else:
@@ -260,7 +322,10 @@ class Logic:
 
     @staticmethod
     def deep_simplify(requirements, opaques):
-        simplified = [len(req.disjunction) > 5 for req in requirements]
+        simplified = [
+            isinstance(req, ThresholdDNFInventory) or len(req.disjunction) > 5
+            for req in requirements
+        ]
         visited = set()
         todo_list = list((range(len(requirements))))
 
@@ -279,7 +344,7 @@ class Logic:
             new_req = DNFInventory()
             for possibility in requirements[item].disjunction:
                 simplified_conj = []
-                for req_item in possibility.intset:
+                for req_item in possibility:
                     item_req, h_a_v = simplify(req_item)
                     hit_a_visited = hit_a_visited | h_a_v
                     simplified_conj.append(item_req.remove(item))
@@ -306,13 +371,21 @@ class Logic:
         /,
         optim=True,
         requirements: List[DNFInventory] | None = None,
+        base: Logic | None = None,
     ):
+        # base brings its own requirements
+        assert requirements is None or base is None
         self.areas = areas
         self.short_to_full = areas.short_to_full
         self.full_to_short = areas.full_to_short
 
         self.requirements = areas.requirements.copy()
         self.opaque = areas.opaque.copy()
+        # A copy, so that the engines of base don't log the changes of this logic
+        self.table = RequirementTable() if base is None else base.table.copy()
+        self.engine = FillEngine(self.table)
+        self.free_engine = FillEngine(self.table)
+        self.free_simplified: Set[int] = set()
 
         if requirements is not None:
             self.requirements = requirements.copy()
@@ -321,6 +394,12 @@ class Logic:
         self.exit_to_area = areas.exit_to_area
         self.placement = placement
         self.fixed_locations = list(placement.locations)
+        self.fixed_checks = 0
+        for loc in self.fixed_locations:
+            if loc in EXTENDED_ITEM:
+                self.fixed_checks |= 1 << EXTENDED_ITEM[loc]
+        # Checks that hold an item, kept up to date by place_item and replace_item
+        self.taken_checks = self.fixed_checks
 
         self.banned = logic_settings.banned
         banned_bit_inv = DNFInventory(BANNED_BIT)
@@ -331,8 +410,36 @@ class Logic:
         self.frees = logic_settings.starting_inventory
 
         self.backup_requirements = self.requirements.copy()
+        self.full_inventory = self.inventory
+
+        if base is not None:
+            # Same areas, runtime requirements, bans and transitions as base,
+            # only the items base placed after its own creation are missing
+            self.requirements = base.plain_requirements.copy()
+            self.opaque = base.opaque.copy()
+            self.backup_requirements = self.requirements.copy()
+            base_fixed_locations = set(base.fixed_locations)
+            for k, v in self.placement.locations.items():
+                if k not in base_fixed_locations:
+                    self.place_item(k, v, fill=False)
+        else:
+            self.compile_requirements(logic_settings.runtime_requirements)
+
+        # The requirements before optimisation, to hand them over to a new logic
+        self.plain_requirements = self.requirements.copy()
+        if optim:
+            self.free_simplify(self.requirements, self.frees, self.free_engine)
+            self.shallow_simplify(self.requirements, self.opaque)
+            self.fill_inventory_i(monotonic=True)
+        self.backup_requirements = self.requirements.copy()
+        self.aggregate = self.aggregate_requirements(self.requirements, None)
+        self.table.sync(self.requirements)
+        # Requirements that differ from their backup since fill_inventory_i
+        # made them trivially true
+        self.free_simplified = set()
 
-        for loc, req in logic_settings.runtime_requirements.items():
+    def compile_requirements(self, runtime_requirements: Dict[EIN, DNFInventory]):
+        for loc, req in runtime_requirements.items():
             it = EXTENDED_ITEM[loc]
             # assert self.opaque[it]
             self.requirements[it] |= self.ban_if(loc, req)
@@ -344,29 +451,22 @@ class Logic:
         for exit, entrance in self.placement.map_transitions.items():
             self.link_connection(exit, entrance)
 
-        self.full_inventory = self.inventory
         for k, v in self.placement.locations.items():
             self.place_item(k, v, fill=False)
 
-        pure_usefuls = self.aggregate_requirements(areas.requirements, None)
+        banned_bit_inv = DNFInventory(BANNED_BIT)
+        pure_usefuls = self.aggregate_requirements(self.areas.requirements, None)
         for it in self.banned:
             if it not in EXTENDED_ITEM:
                 continue
             bit = EXTENDED_ITEM[it]
-            if self.areas.requirements[bit].is_impossible() or bit not in pure_usefuls:
+            if self.areas.requirements[bit].is_impossible() or not pure_usefuls[bit]:
                 self.requirements[bit] &= banned_bit_inv
             else:
                 raise ValueError(
                     f"Cannot ban potentially inlined away requirement {it}"
                 )
 
-        if optim:
-            self.free_simplify(self.requirements, self.frees)
-            self.shallow_simplify(self.requirements, self.opaque)
-            self.fill_inventory_i(monotonic=True)
-        self.backup_requirements = self.requirements.copy()
-        self.aggregate = self.aggregate_requirements(self.requirements, None)
-
     def add_item(self, item: EXTENDED_ITEM):
         self.inventory |= item
         self.full_inventory |= item
@@ -386,14 +486,21 @@ class Logic:
     def remove_items(self, items: Iterable[EXTENDED_ITEM]):
         for item in items:
             self.inventory = self.inventory.remove(item)
-        if any(item in self.aggregate.intset for item in items):
+        if any(self.aggregate[item] for item in items):
             self.fill_inventory_i()
 
     def fill_inventory_i(self, monotonic=False):
         # self.shallow_simplify()
-        self.free_simplify(self.requirements, self.frees)
+        req = DNFInventory(True)
+        for i in self.free_simplifications(
+            self.requirements, self.frees, self.free_engine
+        ):
+            self.requirements[i] = req
+            self.free_simplified.add(i)
         inventory = self.full_inventory if monotonic else self.inventory
-        self.full_inventory = self.fill_inventory(self.requirements, inventory)
+        self.full_inventory = self.fill_inventory(
+            self.requirements, inventory, self.engine
+        )
 
     @staticmethod
     def explore(checks, area: Area) -> Iterable[EIN]:
@@ -407,11 +514,40 @@ class Logic:
 
         return explore(area)
 
-    @cache
+    def check_index(self, placement_limit: EIN) -> CheckIndex:
+        indices = self.areas.check_indices
+        if (index := indices.get(placement_limit)) is None:
+            checks = list(
+                dict.fromkeys(
+                    self.explore(self.areas.checks, self.areas[placement_limit])
+                )
+            )
+            bits = [EXTENDED_ITEM[loc] for loc in checks]
+            mask = 0
+            for bit in bits:
+                mask |= 1 << bit
+            positions = None
+            if bits != sorted(bits):
+                positions = {bit: i for i, bit in enumerate(bits)}
+            index = indices[placement_limit] = CheckIndex(checks, mask, positions)
+        return index
+
     def check_list(self, placement_limit: EIN) -> List[EIN]:
-        return list(
-            dict.fromkeys(self.explore(self.areas.checks, self.areas[placement_limit]))
-        )
+        return self.check_index(placement_limit).checks
+
+    @staticmethod
+    def checks_of_mask(index: CheckIndex, mask: int) -> List[EIN]:
+        if mask == index.mask:
+            return list(index.checks)
+        bits = []
+        while mask:
+            low = mask & -mask
+            bits.append(low.bit_length() - 1)
+            mask ^= low
+        if index.positions is not None:
+            bits.sort(key=index.positions.__getitem__)
+        items_list = EXTENDED_ITEM.items_list
+        return [items_list[bit] for bit in bits]
 
     def accessible_checks(self, placement_limit: EIN = EIN("")) -> List[EIN]:
         if placement_limit in self.areas.checks:
@@ -422,12 +558,21 @@ class Logic:
                 return []
             return [EIN(placement_limit)]
         else:
+            index = self.check_index(placement_limit)
+            mask = index.mask & self.full_inventory.bitset & ~self.fixed_checks
+            return self.checks_of_mask(index, mask)
+
+    def accessible_empty_checks(self, placement_limit: EIN = EIN("")) -> List[EIN]:
+        if placement_limit in self.areas.checks:
             return [
                 loc
-                for loc in self.check_list(placement_limit)
-                if self.full_inventory[EXTENDED_ITEM[loc]]
-                and loc not in self.fixed_locations
+                for loc in self.accessible_checks(placement_limit)
+                if loc not in self.placement.locations
             ]
+        index = self.check_index(placement_limit)
+        taken = self.taken_checks | self.fixed_checks
+        mask = index.mask & self.full_inventory.bitset & ~taken
+        return self.checks_of_mask(index, mask)
 
     def accessible_stones(self) -> Iterable[EIN]:
         for stone in self.areas.gossip_stones:
@@ -535,6 +680,8 @@ class Logic:
             self.placement.stones[location].append(item)
         else:
             self.placement.locations[location] = item
+            if location in EXTENDED_ITEM:
+                self.taken_checks |= 1 << EXTENDED_ITEM[location]
         return True
 
     def replace_item(self, location: EIN, item: EIN, old_hint: EIN | None = None):
@@ -555,6 +702,8 @@ class Logic:
                 raise ValueError(f"Item {item} is already placed.")
             old_item = self.placement.locations[location]
             del self.placement.locations[location]
+            if location in EXTENDED_ITEM:
+                self.taken_checks &= ~(1 << EXTENDED_ITEM[location])
             del self.placement.items[old_item]
 
         if old_item in EXTENDED_ITEM:
@@ -562,7 +711,11 @@ class Logic:
             old_item_bit = EXTENDED_ITEM[old_item]
             self.opaque[old_item_bit] = True
             self.backup_requirements[old_item_bit] = DNFInventory()
-            self.requirements = self.backup_requirements.copy()
+            # The frees may not give the old item anymore, so undo what
+            # they simplified, only those requirements differ from the backup
+            for i in [*self.free_simplified, old_item_bit]:
+                self.requirements[i] = self.backup_requirements[i]
+            self.free_simplified.clear()
             self.fill_inventory_i()
 
         self.place_item(location, item, hint_mode=hint_mode)
@@ -1,10 +1,9 @@
 from __future__ import annotations
 from typing import Dict, List, Callable, Optional, Set, Tuple
 from dataclasses import dataclass
-from functools import reduce
 from abc import ABC
 import re
-from itertools import product, combinations
+from itertools import combinations
 
 from .inventory import EXTENDED_ITEM, Inventory, EMPTY_INV, DAY_BIT, NIGHT_BIT
 from .constants import EXTENDED_ITEM_NAME, number, ITEM_COUNTS, RAW_ITEM_NAMES
@@ -40,6 +39,46 @@ class LogicExpression(ABC):
         return self & BasicTextAtom("Night")
 
 
+class DNFIndex:
+    """
+    Indexes the conjunctions of a disjunction by popcount, for subset and
+    superset queries on their bitsets.
+
+    Subsets are looked up in the order of the disjunction, which is the order
+    they were added in, strict supersets only in the buckets of greater
+    popcount. Conjunctions popped from the index are popped from the
+    disjunction too.
+    """
+
+    def __init__(self, disjunction: Dict[Inventory, Inventory]):
+        self.disjunction = disjunction
+        self.buckets: Dict[int, Dict[int, Inventory]] = {}
+        for conj in disjunction:
+            self.add(conj)
+
+    def add(self, conj: Inventory):
+        """Indexes [conj], which must have been added last to the disjunction"""
+        self.buckets.setdefault(conj.bitset.bit_count(), {})[conj.bitset] = conj
+
+    def first_subset(self, bitset: int) -> Inventory | None:
+        """The first indexed conjunction included in [bitset]"""
+        for conj in self.disjunction:
+            if not conj.bitset & ~bitset:
+                return conj
+        return None
+
+    def pop_supersets(self, bitset: int, conj_pre: Inventory) -> Inventory:
+        """Pops the conjunctions strictly including [bitset], merging their values into [conj_pre]"""
+        popcount = bitset.bit_count()
+        for size, bucket in self.buckets.items():
+            if size <= popcount:
+                continue
+            for bits in [bits for bits in bucket if bits & bitset == bitset]:
+                conj = bucket.pop(bits)
+                conj_pre &= self.disjunction.pop(conj)
+        return conj_pre
+
+
 class DNFInventory(LogicExpression):
     disjunction: Dict[Inventory, Inventory]
 
@@ -74,7 +113,8 @@ class DNFInventory(LogicExpression):
             self.disjunction = {inv: inv}
 
     def eval(self, inventory: Inventory):
-        return any(req_items <= inventory for req_items in self.disjunction)
+        bits = inventory.bitset
+        return any(not req_items.bitset & ~bits for req_items in self.disjunction)
 
     def localize(self, *args):
         return self
@@ -82,20 +122,13 @@ class DNFInventory(LogicExpression):
     def __or__(self, other) -> DNFInventory:
         if isinstance(other, DNFInventory):
             filtered_self = self.disjunction.copy()
+            index = DNFIndex(filtered_self)
             filtered_other = {}
             for conj, conj_pre in other.disjunction.items():
-                to_pop = []
-                for conj2 in filtered_self:
-                    if conj <= conj2 and conj != conj2:
-                        conj_pre &= filtered_self[conj2]
-                        to_pop.append(conj2)
-                    if conj2 <= conj:
-                        filtered_self[conj2] &= conj_pre
-                        break
+                if (subset := index.first_subset(conj.bitset)) is not None:
+                    filtered_self[subset] &= conj_pre
                 else:
-                    for c in to_pop:
-                        del filtered_self[c]
-                    filtered_other[conj] = conj_pre
+                    filtered_other[conj] = index.pop_supersets(conj.bitset, conj_pre)
             return DNFInventory((filtered_self | filtered_other))
         else:
             return super().__or__(other)
@@ -119,10 +152,10 @@ class DNFInventory(LogicExpression):
         return not self.disjunction
 
     def aggregate(self):
-        ag = Inventory()
+        bits = 0
         for r in self.disjunction:
-            ag |= r
-        return ag
+            bits |= r.bitset
+        return Inventory.of_bitset(bits)
 
     def day_only(self):
         return DNFInventory(
@@ -135,11 +168,86 @@ class DNFInventory(LogicExpression):
         )
 
 
-def InventoryAtom(item_name: str, quantity: int) -> DNFInventory:
+class ThresholdDNFInventory(DNFInventory):
+    """
+    At least [quantity] items out of [group].
+
+    The fill engines evaluate it with a popcount on the bitset of the group,
+    the disjunction of every combination of [quantity] items is only expanded
+    when some code needs it.
+    """
+
+    def __init__(self, group: Inventory, quantity: int):
+        self.group = group
+        self.quantity = quantity
+        self._disjunction: Dict[Inventory, Inventory] | None = None
+
+    @property
+    def disjunction(self) -> Dict[Inventory, Inventory]:
+        if self._disjunction is None:
+            self._disjunction = {}
+            for comb in combinations(self.group, self.quantity):
+                i = Inventory(set(comb))
+                self._disjunction[i] = i
+        return self._disjunction
+
+    def eval(self, inventory: Inventory):
+        return (self.group.bitset & inventory.bitset).bit_count() >= self.quantity
+
+    def __repr__(self) -> str:
+        return f"ThresholdDNFInventory({self.group!r}, {self.quantity})"
+
+    def is_impossible(self):
+        return self.quantity > self.group.count()
+
+    def aggregate(self):
+        return self.group
+
+    def day_only(self):
+        return self
+
+    def night_only(self):
+        return self
+
+
+# Threshold atoms met while parsing, they get their own bit once the areas are built
+thresholds: Dict[EXTENDED_ITEM_NAME, Tuple[str, int]] = {}
+
+
+def threshold_name(item_name: str, quantity: int) -> EXTENDED_ITEM_NAME:
+    return EXTENDED_ITEM_NAME(f"{item_name} x {quantity}")
+
+
+@dataclass
+class ThresholdAtom(LogicExpression):
+    item_name: str
+    quantity: int
+
+    def eval(self, *args):
+        raise TypeError("Threshold atoms must be localized to be evaluated.")
+
+    def localize(self, localizer):
+        ret = EventAtom(threshold_name(self.item_name, self.quantity))
+        ret.opaque = self.opaque
+        return ret
+
+    def __str__(self):
+        return f"{self.item_name} x {self.quantity}"
+
+
+def InventoryAtom(item_name: str, quantity: int) -> LogicExpression:
     if GLOBAL_DUMP_MODE:
         if quantity == 1:
             return BasicTextAtom(f"{item_name}")
         return BasicTextAtom(f"{item_name} x {quantity}")
+    if 0 < quantity < ITEM_COUNTS[item_name]:
+        # Refer to a threshold bit instead of expanding every combination
+        name = threshold_name(item_name, quantity)
+        if name in EXTENDED_ITEM:
+            return DNFInventory(EXTENDED_ITEM[name])
+        if not EXTENDED_ITEM.complete:
+            thresholds[name] = (item_name, quantity)
+            return ThresholdAtom(item_name, quantity)
     disjunction = set()
     for comb in combinations(range(ITEM_COUNTS[item_name]), quantity):
         i = Inventory()
@@ -186,27 +294,30 @@ class BasicTextAtom(LogicExpression):
         return self.text
 
 
-def and_reducer(v, v1):
-    a, b = v
-    a1, b1 = v1
-    return a | a1, b | b1
-
-
 @dataclass
 class AndCombination(LogicExpression):
     arguments: List[LogicExpression]
 
     @staticmethod
     def simplifyDNF(arguments: List[DNFInventory]) -> DNFInventory:
-        disjunctions = map(lambda x: x.disjunction.items(), arguments)
-
-        new_req = DNFInventory()
-        for conjunction_tuple in product(*disjunctions):
-            conj, conj_pre = reduce(
-                and_reducer, conjunction_tuple, (EMPTY_INV, EMPTY_INV)
-            )
-            new_req |= DNFInventory(({conj: conj_pre}))
-        return new_req
+        disjunctions = [list(arg.disjunction.items()) for arg in arguments]
+        new_disjunction: Dict[Inventory, Inventory] = {}
+        index = DNFIndex(new_disjunction)
+
+        # Walks the product depth-first, and prunes a partial product as soon as
+        # it is dominated, since all the products extending it will be too
+        def extend(depth: int, conj: Inventory, conj_pre: Inventory):
+            if (subset := index.first_subset(conj.bitset)) is not None:
+                new_disjunction[subset] &= conj_pre
+            elif depth == len(disjunctions):
+                new_disjunction[conj] = index.pop_supersets(conj.bitset, conj_pre)
+                index.add(conj)
+            else:
+                for conj2, conj_pre2 in disjunctions[depth]:
+                    extend(depth + 1, conj | conj2, conj_pre | conj_pre2)
+
+        extend(0, EMPTY_INV, EMPTY_INV)
+        return DNFInventory(new_disjunction)
 
     @staticmethod
     def simplify(arguments: List[LogicExpression]) -> LogicExpression:
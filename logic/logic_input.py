@@ -4,7 +4,13 @@ from functools import cache
 from enum import Enum
 from dataclasses import dataclass, field
 
-from .logic_expression import DNFInventory, LogicExpression, EventAtom
+from .logic_expression import (
+    DNFInventory,
+    LogicExpression,
+    EventAtom,
+    ThresholdDNFInventory,
+    thresholds,
+)
 from .inventory import EXTENDED_ITEM, Inventory
 from .constants import *
 
@@ -235,6 +241,25 @@ class Areas:
             return EIN(area.name)
         return area
 
+    def short_to_full(self, elt: str):
+        if elt in LOGIC_OPTIONS or "Trick" in elt:
+            return EIN(elt)
+        for tag in ["_DAY", "_NIGHT"]:
+            if elt[-len(tag) :] == tag:
+                return EIN(self.short_to_full(elt[: -len(tag)]) + tag)
+        for a, b in self.short_full:
+            if a == elt:
+                return b
+        b = self.search("", elt)
+        self.short_full.append((elt, b))
+        return b
+
+    def full_to_short(self, elt: EXTENDED_ITEM_NAME):
+        for a, b in self.short_full:
+            if b == elt:
+                return a
+        raise ValueError(f"Error: association list, cannot find {elt}.")
+
     def prettify(self, s):
         if s in ALL_ITEM_NAMES:
             return strip_item_number(s)
@@ -273,6 +298,7 @@ class Areas:
                 self.parent_area[area.toplevel_alias] = area
 
         assert not EXTENDED_ITEM.complete
+        EXTENDED_ITEM.items_list.extend(thresholds)
         EXTENDED_ITEM.items_list.extend(events)
         for area in areas_list:
             if area.allowed_time_of_day == Both:
@@ -333,6 +359,8 @@ class Areas:
         self.short_full: List[Tuple[str, EXTENDED_ITEM_NAME]] = [("", EIN(""))]
         self.entrance_allowed_time_of_day = {}
         self.checks = {}
+        # Filled lazily by Logic.check_index
+        self.check_indices: Dict[EIN, Any] = {}
         self.gossip_stones = {}
         self.events = {}
         self.map_exits = {}
@@ -395,29 +423,7 @@ class Areas:
             entrance["hint_region"] = self.areas[area_name].hint_region
             self.map_entrances[full_address] = entrance
 
-        EXTENDED_ITEM.complete = True
-
-        def short_to_full(elt: str):
-            if elt in LOGIC_OPTIONS or "Trick" in elt:
-                return EIN(elt)
-            for tag in ["_DAY", "_NIGHT"]:
-                if elt[-len(tag) :] == tag:
-                    return EIN(short_to_full(elt[: -len(tag)]) + tag)
-            for a, b in self.short_full:
-                if a == elt:
-                    return b
-            b = self.search("", elt)
-            self.short_full.append((elt, b))
-            return b
-
-        def full_to_short(elt: EXTENDED_ITEM_NAME):
-            for a, b in self.short_full:
-                if b == elt:
-                    return a
-            raise ValueError(f"Error: association list, cannot find {elt}.")
-
-        self.short_to_full = short_to_full
-        self.full_to_short = full_to_short
+        EXTENDED_ITEM.freeze()
 
         self.exit_to_area = {}
 
@@ -427,6 +433,12 @@ class Areas:
         reqs = self.requirements  # Local alias
         DNFInv = DNFInventory
 
+        for name, (item_name, quantity) in thresholds.items():
+            group = Inventory((item_name, ITEM_COUNTS[item_name]))
+            threshold_bit = EXTENDED_ITEM[name]
+            self.opaque[threshold_bit] = False
+            reqs[threshold_bit] = ThresholdDNFInventory(group, quantity)
+
         for area_name, area in self.areas.items():
             if area.can_sleep:
                 # If one day we allow sleeping to be randomized, change the following to regular connections
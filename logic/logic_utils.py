@@ -1,9 +1,11 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from functools import cache
-from typing import List  # Only for typing purposes
+import heapq
+from typing import Iterable, List  # Only for typing purposes
 
 from .logic import Logic, Placement, LogicSettings
+from .fill_engine import RequirementTable, batch_fill
 from .logic_input import Areas
 from .logic_expression import DNFInventory
 from .inventory import (
@@ -42,6 +44,7 @@ class LogicUtils(Logic):
         banned,
         /,
         reqs: List[DNFInventory] | None = None,
+        base: Logic | None = None,
     ):
         starting_inventory = Inventory(
             {EXTENDED_ITEM[itemname] for itemname in placement.starting_items}
@@ -49,8 +52,12 @@ class LogicUtils(Logic):
         settings = LogicSettings(
             starting_inventory, EMPTY_INV, runtime_requirements, banned
         )
-        super().__init__(areas, settings, placement, optim=False, requirements=reqs)
-        self.full_inventory = Logic.get_everything_unbanned(self.requirements)
+        super().__init__(
+            areas, settings, placement, optim=False, requirements=reqs, base=base
+        )
+        self.full_inventory = Logic.get_everything_unbanned(
+            self.requirements, self.backup_requirements
+        )
         self.required_dungeons = additional_info.required_dungeons
         self.unrequired_dungeons = additional_info.unrequired_dungeons
         self.randomized_dungeon_entrance = additional_info.randomized_dungeon_entrance
@@ -59,6 +66,7 @@ class LogicUtils(Logic):
         self.randomized_start_statues = additional_info.randomized_start_statues
         self.known_locations = additional_info.known_locations
         self.puzzles = additional_info.puzzles
+        self.sots_items: Dict[EXTENDED_ITEM, List[EIN]] = {}
 
     def check(self, useroutput):
         full_inventory = Logic.fill_inventory(self.requirements, EMPTY_INV)
@@ -70,7 +78,7 @@ class LogicUtils(Logic):
 
         if not full_inventory[EVERYTHING_BIT]:
             (everything_req,) = self.requirements[EVERYTHING_BIT].disjunction
-            i = next(iter(everything_req.intset - full_inventory.intset))
+            i = next(iter(everything_req - full_inventory))
             check = self.areas.full_to_short(EXTENDED_ITEM.get_item_name(i))
             raise useroutput.GenerationFailed(f"Could not reach check {check}.")
 
@@ -89,12 +97,25 @@ class LogicUtils(Logic):
 
     @cache
     def _fill_for_test(self, banned_intset, inventory):
-        custom_requirements = self.requirements.copy()
-        for index, e in enumerate(reversed(bin(banned_intset))):
-            if e == "1":
-                custom_requirements[index] = DNFInventory(False)
+        (full,) = self.batch_fill_restricted([banned_intset], inventory)
+        return full
 
-        return Logic.fill_inventory(custom_requirements, inventory)
+    def batch_fill_restricted(
+        self,
+        banned_intsets: List[int],
+        starting_inventory: None | Inventory = None,
+    ) -> List[Inventory]:
+        """
+        Fills the starting inventory once for every banned intset, as if the
+        banned items were impossible to get. All the fills are done together.
+        """
+        if starting_inventory is None:
+            starting_inventory = self.inventory
+
+        self.table.sync(self.requirements)
+        return batch_fill(
+            self.table, [starting_inventory] * len(banned_intsets), banned_intsets
+        )
 
     def fill_restricted(
         self,
@@ -154,19 +175,32 @@ class LogicUtils(Logic):
 
         return aggregate
 
-    @cache
-    def _get_sots_items(self, index: EXTENDED_ITEM):
-        usefuls = self.get_useful_items(index)
-        return [
+    def goal_indices(self) -> List[EXTENDED_ITEM]:
+        goals = [DUNGEON_GOALS[dun] for dun in self.required_dungeons] + [DEMISE]
+        return [EXTENDED_ITEM[self.short_to_full(GOAL_CHECKS[goal])] for goal in goals]
+
+    def compute_sots_items(self, indices: List[EXTENDED_ITEM]):
+        """
+        Finds the items required for every index. A single batched fill
+        bans every item useful for any of them in turn, so all the indices
+        are answered together.
+        """
+        usefuls = {index: set(self.get_useful_items(index)) for index in indices}
+        candidates = [
             item
             for item in INVENTORY_ITEMS
-            if item in usefuls
-            and not self.restricted_test(
-                index,
-                [EXTENDED_ITEM[item]],
-                starting_inventory=self.inventory | HINT_BYPASS_BIT,
-            )
+            if any(item in useful for useful in usefuls.values())
         ]
+        restricted_fulls = self.batch_fill_restricted(
+            [1 << EXTENDED_ITEM[item] for item in candidates],
+            starting_inventory=self.inventory | HINT_BYPASS_BIT,
+        )
+        for index, useful in usefuls.items():
+            self.sots_items[index] = [
+                item
+                for item, restricted_full in zip(candidates, restricted_fulls)
+                if item in useful and not restricted_full[index]
+            ]
 
         # requireds: Inventory = self.congregate_requirements(index)  # type: ignore
         # return [
@@ -178,7 +212,10 @@ class LogicUtils(Logic):
     def get_sots_items(self, index: EXTENDED_ITEM | None = None):
         if index is None:
             index = EXTENDED_ITEM[self.short_to_full(DEMISE)]
-        return self._get_sots_items(index)
+        if index not in self.sots_items:
+            # Every goal will be asked for, answer them all at once
+            self.compute_sots_items(list(dict.fromkeys([index, *self.goal_indices()])))
+        return self.sots_items[index]
 
     def get_sots_locations(self, index: EXTENDED_ITEM | None = None):
         if index is None:
@@ -202,7 +239,7 @@ class LogicUtils(Logic):
         )
         return [
             loc
-            for i in usefuls.intset
+            for i in usefuls
             if (loc := EXTENDED_ITEM.get_item_name(i)) in INVENTORY_ITEMS
         ]
 
@@ -211,7 +248,7 @@ class LogicUtils(Logic):
         if not res:
             res = [
                 loc
-                for i in self.full_inventory.intset
+                for i in self.full_inventory
                 if (loc := EXTENDED_ITEM.get_item_name(i)) in PROGRESS_ITEMS
             ]
         return res
@@ -258,32 +295,70 @@ class LogicUtils(Logic):
         return self._get_barren_regions(bit)
 
     def calculate_playthrough_progression_spheres(self):
+        """
+        Every sphere is a fixpoint of scans in index order, where the useful
+        items found are only usable from the next sphere on. Instead of
+        rescanning, the requirements that may just have been met are found
+        through the dependency index, and a heap orders what they unlock by
+        scan then index, as the scans would have found it.
+        """
+        table = RequirementTable(self.backup_requirements)
+        masks = table.masks
+        thresholds = table.thresholds
+        dependents = table.dependents
+
+        def satisfied(i: int, bits: int) -> bool:
+            for conj_bits in masks[i]:
+                if conj_bits & bits == conj_bits:
+                    return True
+            if (threshold := thresholds[i]) is not None:
+                group, quantity = threshold
+                return (group & bits).bit_count() >= quantity
+            return False
+
+        usefuls = 0
+        for item in self.get_useful_items():
+            if item in EXTENDED_ITEM:
+                usefuls |= 1 << EXTENDED_ITEM[item]
+        demise_bit = EXTENDED_ITEM[self.short_to_full(DEMISE)]
+
         spheres = []
-        inventory = self.inventory | HINT_BYPASS_BIT
-        inventory2 = inventory
-        requirements = self.backup_requirements
-        usefuls = self.get_useful_items()
+        inventory = (self.inventory | HINT_BYPASS_BIT).bitset
+        found = inventory
+        candidates: Iterable[int] = range(len(table))
         while True:
             sphere = []
-            keep_going = True
-            while keep_going:
-                keep_going = False
-                for i in EXTENDED_ITEM.items():
-                    if not inventory2[i] and requirements[i].eval(inventory):
-                        keep_going = True
-                        inventory2 |= i
-                        if (item := EXTENDED_ITEM.get_item_name(i)) in usefuls:
-                            loc = self.placement.items[item]
-                            sphere.append(loc)
-                        elif i == EXTENDED_ITEM[self.short_to_full(DEMISE)]:
-                            sphere.append(DEMISE)
-                        else:
-                            inventory |= i
-            inventory = inventory2
+            # Items only usable from the next sphere on
+            held_back = []
+            heap = [
+                (0, i)
+                for i in candidates
+                if not found >> i & 1 and satisfied(i, inventory)
+            ]
+            heapq.heapify(heap)
+            while heap:
+                scan, i = heapq.heappop(heap)
+                if found >> i & 1:
+                    continue
+                found |= 1 << i
+                if usefuls >> i & 1:
+                    sphere.append(self.placement.items[EXTENDED_ITEM.get_item_name(i)])
+                    held_back.append(i)
+                elif i == demise_bit:
+                    sphere.append(DEMISE)
+                    held_back.append(i)
+                else:
+                    inventory |= 1 << i
+                    for j in dependents[i]:
+                        if not found >> j & 1 and satisfied(j, inventory):
+                            # Found later in this scan, or in the next one
+                            heapq.heappush(heap, (scan if j > i else scan + 1, j))
+            inventory = found
             if sphere:
                 spheres.append(sphere)
             else:
                 break
+            candidates = {j for i in held_back for j in dependents[i]}
         return spheres
 
     def get_dowsing(self, dowsing_setting):
@@ -122,6 +122,7 @@ class Rando:
                 additional_info,
                 runtime_requirements,
                 self.banned,
+                base=logic,
             )
 
         self.extract_hint_logic = fun
@@ -278,7 +279,7 @@ class Rando:
         for item in self.options["starting-items"]:
             if item == KEY_PIECE:
                 continue
-            elif item not in EXTENDED_ITEM.items_list:
+            elif item not in EXTENDED_ITEM:
                 if number(item, 0) not in starting_items:
                     for count in range(self.options["starting-items"].count(item)):
                         starting_items.add(number(item, count))
@@ -295,7 +296,7 @@ class Rando:
             ]
             if len(possible_random_starting_items) > 0:
                 random_item = self.rng.choice(possible_random_starting_items)
-                if random_item not in EXTENDED_ITEM.items_list:
+                if random_item not in EXTENDED_ITEM:
                     random_item = number(random_item, 0)
                 starting_items.add(random_item)
 
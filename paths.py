@@ -2,6 +2,7 @@ import os
 from pathlib import Path
 
 CUSTOM_HINT_DISTRIBUTION_PATH = Path("custom_hint_distribution.json")
+AREAS_CACHE_PATH = Path("areas.cache")
 
 try:
     # can be imported if running the binary
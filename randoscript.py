@@ -3,19 +3,65 @@ import sys
 import argparse
 import yaml
 import json
+import multiprocessing
+import time
 from logic.dump import dump_constants
 from logic.logic_input import Areas
-from yaml_files import requirements, checks, hints, map_exits
+from logic.areas_cache import load_areas
 
 from ssrando import Randomizer, PlandoRandomizer, VERSION
 from logic.placement_file import PlacementFile
 from options import OPTIONS, Options
 
 
-def get_ranges(start, end, parts):
-    step = (end + 1 - start) / parts
-    for i in range(parts):
-        yield (int(start + step * i), int(start + step * (i + 1)))
+# state shared by the bulk workers, set before the pool is forked
+bulk_areas = None
+bulk_options = None
+
+
+def init_bulk_worker(options):
+    global bulk_areas, bulk_options
+    if bulk_areas is None:
+        # the worker was spawned instead of forked
+        bulk_areas = load_areas()
+    bulk_options = options
+
+
+def run_bulk_seed(seed):
+    result = {"seed": seed, "success": False}
+    start_time = time.perf_counter()
+    try:
+        bulk_options.set_option("seed", seed)
+        rando = Randomizer(bulk_areas, bulk_options)
+        result["hash"] = rando.randomizer_hash
+        rando.randomize()
+        result["success"] = True
+    except KeyboardInterrupt:
+        raise
+    except Exception as e:
+        import traceback
+
+        stack_trace = traceback.format_exc()
+        error_message = f"error seed {seed}:\n\n" + str(e) + "\n\n" + stack_trace
+        print(error_message, file=sys.stderr)
+        result["error"] = str(e)
+    result["time"] = round(time.perf_counter() - start_time, 3)
+    return result
+
+
+def read_bulk_report(report_name):
+    done = set()
+    try:
+        with open(report_name) as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)["seed"])
+                except (ValueError, KeyError):
+                    # a line cut by an interruption
+                    continue
+    except FileNotFoundError:
+        pass
+    return done
 
 
 def main():
@@ -96,6 +142,17 @@ def main():
         type=int,
         dest="bulk_threads",
     )
+    bulk_opts.add_argument(
+        "--report",
+        help="specify a file to write the result of every seed to, one json object per line",
+        dest="bulk_report",
+    )
+    bulk_opts.add_argument(
+        "--resume",
+        help="skip the seeds already in the report file",
+        action="store_true",
+        dest="bulk_resume",
+    )
 
     parsed_args = parser.parse_args()
     if parsed_args.version:
@@ -123,6 +180,7 @@ def main():
     if dest := parsed_args.dump_graph:
         import logic
         from logic.logic_input import Area
+        from yaml_files import requirements, checks, hints, map_exits
 
         logic.logic_expression.GLOBAL_DUMP_MODE = True
         areas = Areas(requirements, checks, hints, map_exits)
@@ -138,7 +196,7 @@ def main():
             )
             exit(0)
 
-    areas = Areas(requirements, checks, hints, map_exits)
+    areas = load_areas()
 
     plcmt_file_name = parsed_args.placement_file
     if plcmt_file_name is not None:
@@ -172,35 +230,36 @@ def main():
 
         options.set_option("dry-run", True)
 
-        def randothread(start, end, local_opts):
-            for i in range(start, end):
-                try:
-                    local_opts.set_option("seed", i)
-                    rando = Randomizer(areas, local_opts)
-                    rando.randomize()
-                except KeyboardInterrupt:
-                    raise
-                except Exception as e:
-                    import traceback
-
-                    stack_trace = traceback.format_exc()
-                    error_message = (
-                        f"error seed {i}:\n\n" + str(e) + "\n\n" + stack_trace
-                    )
-                    print(error_message, file=sys.stderr)
-
-        if bulk_threads == 1:
-            randothread(bulk_low, bulk_high, options)
-        else:
-            from multiprocessing import Process
-
-            threads = []
-            for start, end in get_ranges(bulk_low, bulk_high, bulk_threads):
-                thread = Process(target=randothread, args=(start, end, options.copy()))
-                thread.start()
-                threads.append(thread)
-            for thread in threads:
-                thread.join()
+        report_name = parsed_args.bulk_report
+        seeds = range(bulk_low, bulk_high + 1)
+        if parsed_args.bulk_resume:
+            if report_name is None:
+                print("--resume requires --report!")
+                exit(1)
+            done = read_bulk_report(report_name)
+            seeds = [seed for seed in seeds if seed not in done]
+
+        global bulk_areas
+        bulk_areas = areas
+        pool = None
+        report = open(report_name, "a") if report_name is not None else None
+        try:
+            if bulk_threads == 1:
+                init_bulk_worker(options)
+                results = map(run_bulk_seed, seeds)
+            else:
+                # workers inherit the already built areas
+                pool = multiprocessing.Pool(bulk_threads, init_bulk_worker, (options,))
+                results = pool.imap_unordered(run_bulk_seed, seeds)
+            for result in results:
+                if report is not None:
+                    report.write(json.dumps(result) + "\n")
+                    report.flush()
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if report is not None:
+                report.close()
     elif options["noui"]:
         rando = Randomizer(areas, options)
         if not options["dry-run"]:
@@ -223,4 +282,6 @@ def main():
 
 
 if __name__ == "__main__":
+    # needed for process pools in frozen builds
+    multiprocessing.freeze_support()
     main()
@@ -7,9 +7,12 @@ import shutil
 
 import colorReplace as cr
 from paths import RANDO_ROOT_PATH
+from version import VERSION
 import os
 import json
 import tempfile
+import multiprocessing
+import hashlib
 
 import nlzss11
 from .bzs import ParsedBzs, parseBzs, buildBzs
@@ -37,6 +40,27 @@ OARC_PATH = Path("oarc")
 
 MASK_REGEX = re.compile(r"(.+(/|\\))*(?P<texName>.+)__(?P<colorGroupName>.+).png")
 
+# Bump this when the way patched files are produced changes without a version change
+PATCH_CACHE_VERSION = 2
+DEFAULT_PATCH_CACHE_SIZE = 1024 * 1024 * 1024
+
+
+# patcher of the current worker process, when patching with a process pool
+worker_patcher = None
+
+
+def init_patch_worker(patcher):
+    global worker_patcher
+    worker_patcher = patcher
+
+
+def patch_stage_worker(stagepath):
+    return worker_patcher.patch_stage(stagepath)
+
+
+def patch_event_worker(args):
+    return worker_patcher.patch_event(args)
+
 
 class AllPatcher:
     def __init__(
@@ -49,12 +73,19 @@ class AllPatcher:
         current_player_model_pack_name: str,
         current_loftwing_model_pack_name: str,
         copy_unmodified: bool = True,
+        processes: int = 1,
+        patch_cache_path: Optional[Path] = None,
+        patch_cache_size: int = DEFAULT_PATCH_CACHE_SIZE,
     ):
         """
         Creates a new instance of the AllPatcher, which patches the game files but with a single callback for each resource type
         actual_extract_path: a path pointing to the root directory of the extracted game, so that it has the subdirectories DATA and UPDATE
         modified_extract_path: a path where to write the patched files to, should be a copy of the actual extract if intended to be repacked into an iso
         copy_unmodified: If unmodified Stage and Event files should be copied, other files are never copied
+        processes: how many processes to patch the stage and event files with
+        patch_cache_path: a directory to keep the patched stage and event files in, so that they are reused
+            if neither the original file nor its patches changed, see set_stage_patch_key and set_event_patch_key
+        patch_cache_size: the size in bytes the patch cache is trimmed to after patching, least recently used files first
         """
         self.actual_extract_path = actual_extract_path
         self.modified_extract_path = modified_extract_path
@@ -63,6 +94,9 @@ class AllPatcher:
         self.current_player_model_pack_name = current_player_model_pack_name
         self.current_loftwing_model_pack_name = current_loftwing_model_pack_name
         self.copy_unmodified = copy_unmodified
+        self.processes = processes
+        self.patch_cache_path = patch_cache_path
+        self.patch_cache_size = patch_cache_size
         self.arc_replacements = {}
         if arc_replacement_path.is_dir():
             for replace_path in arc_replacement_path.rglob("*.arc"):
@@ -78,6 +112,9 @@ class AllPatcher:
         self.event_patch = None
         self.event_text_patch = None
         self.room_brres_patch = None
+        self.stage_patch_key = None
+        self.event_patch_key = None
+        self.arc_replacements_key = None
         self.tmp_dir = Path(tempfile.mkdtemp())
 
         def dummy_progress_callback(action):
@@ -98,8 +135,12 @@ class AllPatcher:
         layer: int,
         oarc: str,
         func: Callable[[str, int, str, U8File], U8File],
+        key: Optional[str] = None,
     ):
-        self.stage_oarc_patch[(stage, layer)].append([oarc, func])
+        """
+        key must serialize everything func depends on, the stage is not cached if it's None
+        """
+        self.stage_oarc_patch[(stage, layer)].append([oarc, func, key])
 
     def delete_stage_oarc(self, stage: str, layer: int, oarcs: Iterable[str]):
         self.stage_oarc_delete[(stage, layer)] = oarcs
@@ -144,6 +185,24 @@ class AllPatcher:
         """
         self.event_text_patch = patchfunc
 
+    def set_stage_patch_key(self, keyfunc: Callable[[str], Optional[str]]):
+        """
+        The function gets called with a stage name, and must return a serialization of everything
+        the patch callbacks depend on for this stage, or None if the stage must not be cached.
+        Together with the original file and the oarcs changes, it is used as the key of the stage
+        in the patch cache
+        """
+        self.stage_patch_key = keyfunc
+
+    def set_event_patch_key(self, keyfunc: Callable[[List[str]], Optional[str]]):
+        """
+        The function gets called with the names of the event files in an event arc (for example `110-DivingGame`),
+        and must return a serialization of everything the event and text patches depend on for these files,
+        or None if the arc must not be cached.
+        Together with the original file, it is used as the key of the arc in the patch cache
+        """
+        self.event_patch_key = keyfunc
+
     def create_oarc_cache(self, extracts):
         self.oarc_cache_path.mkdir(parents=True, exist_ok=True)
         for extract in extracts:
@@ -165,9 +224,9 @@ class AllPatcher:
                     / "ObjectPack.arc.LZ"
                 ).read_bytes()
                 data = nlzss11.decompress(data)
-                data = U8File.parse_u8(BytesIO(data))
+                data = U8File.parse_u8_buffer(data)
                 for arcname in all_not_existing:
-                    arcdata = data.get_file_data(f"oarc/{arcname}.arc")
+                    arcdata = data.get_file_view(f"oarc/{arcname}.arc")
                     (self.oarc_cache_path / f"{arcname}.arc").write_bytes(arcdata)
             else:
                 # check if it already exists first
@@ -192,11 +251,11 @@ class AllPatcher:
                     / f"{stage}_stg_l{layer}.arc.LZ"
                 ).read_bytes()
                 data = nlzss11.decompress(data)
-                data = U8File.parse_u8(BytesIO(data))
+                data = U8File.parse_u8_buffer(data)
 
                 for objname in objs:
                     # print(f'loading {objname} from {stage}, l{layer}')
-                    outdata = data.get_file_data(f"oarc/{objname}.arc")
+                    outdata = data.get_file_view(f"oarc/{objname}.arc")
                     (self.oarc_cache_path / f"{objname}.arc").write_bytes(outdata)
 
     def patch_arc_replacements(self):
@@ -274,8 +333,7 @@ class AllPatcher:
                     meta_data = json.load(f)
             else:
                 meta_data = None
-            arc_bytes = arc_path.read_bytes()
-            parsed_arc = U8File.parse_u8(BytesIO(arc_bytes))
+            parsed_arc = U8File.parse_u8_file(arc_path)
 
             masks_path = data_path / "Masks"
             if masks_path.is_dir() and meta_data.get("Colors"):
@@ -284,7 +342,8 @@ class AllPatcher:
                 )
 
             arc_tmp = self.tmp_dir / arc_name
-            arc_tmp.write_bytes(parsed_arc.to_buffer())
+            with arc_tmp.open("wb") as f:
+                parsed_arc.writeto(f)
             self.arc_replacements[arc_name] = arc_tmp
 
             if model == "Player" and (data_path / "AdditionalArcs").is_dir():
@@ -340,161 +399,22 @@ class AllPatcher:
 
         self.patch_custom_models()
         self.patch_arc_replacements()
+        if self.patch_cache_path is not None:
+            self.patch_cache_path.mkdir(parents=True, exist_ok=True)
+            arc_replacements_key = hashlib.sha256()
+            for arcname, path in sorted(self.arc_replacements.items()):
+                arc_replacements_key.update(arcname.encode())
+                arc_replacements_key.update(hashlib.sha256(path.read_bytes()).digest())
+            self.arc_replacements_key = arc_replacements_key.hexdigest()
 
         # stages
-        for stagepath in (self.actual_extract_path / "DATA" / "files" / "Stage").glob(
-            "*/*_stg_l*.arc.LZ"
-        ):
-            match = STAGE_REGEX.match(stagepath.parts[-1])
-            stage = match[1]
-            layer = int(match[2])
-            self.progress_callback(f"patching {stage} l{layer}")
-            modified_stagepath = (
-                self.modified_extract_path
-                / "DATA"
-                / "files"
-                / "Stage"
-                / f"{stage}"
-                / f"{stage}_stg_l{layer}.arc.LZ"
+        stagepaths = sorted(
+            (self.actual_extract_path / "DATA" / "files" / "Stage").glob(
+                "*/*_stg_l*.arc.LZ"
             )
-            modified = False
-            should_be_copied = False
-            # patch arcs with gamepatches
-            patch_arcs = self.stage_oarc_patch.get((stage, layer), [])
-            # remove some arcs if necessary
-            remove_arcs = set(self.stage_oarc_delete.get((stage, layer), []))
-            # add additional arcs if needed
-            additional_arcs = set(self.stage_oarc_add.get((stage, layer), []))
-            if (
-                patch_arcs
-                or remove_arcs
-                or additional_arcs
-                or layer == 0
-                or self.arc_replacements
-            ):
-                # only decompress and extract files, if needed
-                stagedata = nlzss11.decompress(stagepath.read_bytes())
-                stageu8 = U8File.parse_u8(BytesIO(stagedata))
-
-                # remove arcs that are already added on layer 0
-                if layer != 0:
-                    additional_arcs = additional_arcs - (
-                        set(self.stage_oarc_add.get((stage, 0), [])) - set(("dummy",))
-                    )
-                remove_arcs = remove_arcs - additional_arcs
-                for arc in remove_arcs:
-                    stageu8.delete_file(f"oarc/{arc}.arc")
-                    modified = True
-                patched_arcs = set()
-                for arc in additional_arcs:
-                    if arc == "dummy":
-                        # dummy arcs inserted to make sure this layer gets patched
-                        should_be_copied = True
-                        continue
-                    arcname = f"{arc}.arc"
-                    oarc_path = self.arc_replacements.get(arcname) or (
-                        self.oarc_cache_path / arcname
-                    )
-                    stageu8.add_file_data(f"oarc/{arcname}", oarc_path.read_bytes())
-                    patched_arcs.add(arcname)
-                    modified = True
-
-                if patch_arcs:
-                    for path in stageu8.get_all_paths():
-                        if match := OARC_ARC_REGEX.match(path):
-                            arc = match.group("name")
-                            patches = list(
-                                patch for patch in patch_arcs if patch[0] == arc
-                            )
-                            if patches:
-                                arcdata = stageu8.get_file_data(path)
-                                oarc: U8File = U8File.parse_u8(BytesIO(arcdata))
-                                for patch in patches:
-                                    if new_arc := patch[1](stage, layer, arc, oarc):
-                                        oarc = new_arc
-                                        modified = True
-
-                                if modified:
-                                    patched_arcs.add(arc)
-                                    stageu8.set_file_data(path, oarc.to_buffer())
-
-                if self.arc_replacements:
-                    for path in stageu8.get_all_paths():
-                        if match := OARC_ARC_REGEX.match(path):
-                            arc = match.group("name")
-                            if arc in patched_arcs:
-                                continue
-                            if replacement := self.arc_replacements.get(arc):
-                                stageu8.set_file_data(path, replacement.read_bytes())
-                                patched_arcs.add(arc)
-                                modified = True
-                if layer == 0:
-                    stagebzs = parseBzs(stageu8.get_file_data("dat/stage.bzs"))
-                    # patch stage
-                    if self.bzs_patch or self.room_brres_patch:
-                        if self.bzs_patch:
-                            newstagebzs = self.bzs_patch(stagebzs, stage, None)
-                            if newstagebzs is not None:
-                                stageu8.set_file_data(
-                                    "dat/stage.bzs", buildBzs(newstagebzs)
-                                )
-                                modified = True
-
-                        # patch rooms
-                        room_path_matches = (
-                            ROOM_REGEX.match(x) for x in stageu8.get_all_paths()
-                        )
-                        room_path_matches = (
-                            x for x in room_path_matches if not x is None
-                        )
-                        for room_path_match in room_path_matches:
-                            roomid = int(room_path_match.group("roomid"))
-                            roomdata = stageu8.get_file_data(room_path_match.group(0))
-                            roomarc = U8File.parse_u8(BytesIO(roomdata))
-
-                            if self.bzs_patch:
-                                roombzs = parseBzs(
-                                    roomarc.get_file_data("dat/room.bzs")
-                                )
-                                roombzs = self.bzs_patch(roombzs, stage, roomid)
-                                if roombzs is not None:
-                                    roomarc.set_file_data(
-                                        "dat/room.bzs", buildBzs(roombzs)
-                                    )
-                                    stageu8.set_file_data(
-                                        room_path_match.group(0), roomarc.to_buffer()
-                                    )
-                                    modified = True
-                            if self.room_brres_patch:
-                                roombrres = BRRES.parse_brres(
-                                    BytesIO(roomarc.get_file_data("g3d/room.brres"))
-                                )
-                                roombrres = self.room_brres_patch(
-                                    roombrres, stage, roomid
-                                )
-                                if roombrres is not None:
-                                    roomarc.set_file_data(
-                                        "g3d/room.brres", roombrres.to_buffer().read()
-                                    )
-                                    stageu8.set_file_data(
-                                        room_path_match.group(0), roomarc.to_buffer()
-                                    )
-                                    modified = True
-                    # check if zev.dat can be patched
-                    zev_path = self.assets_path / f"{stage}zev.dat"
-                    if zev_path.is_file():
-                        zev_data = zev_path.read_bytes()
-                        stageu8.set_file_data("dat/zev.dat", zev_data)
-
-            # repack u8 and compress it if modified
-            if modified:
-                stagedata = stageu8.to_buffer()
-                write_bytes_create_dirs(modified_stagepath, nlzss11.compress(stagedata))
-                # print(f'patched {stage} l{layer}')
-            elif self.copy_unmodified or layer == 0 or should_be_copied:
-                # always copy layer 0 because it contains the stage definitions
-                shutil.copy(stagepath, modified_stagepath)
-                # print(f"copied {stage} l{layer}")
+        )
+        for action in self.map_files(patch_stage_worker, self.patch_stage, stagepaths):
+            self.progress_callback(action)
 
         # events and text
         modified_eventrootpath = None
@@ -513,36 +433,14 @@ class AllPatcher:
 
         if modified_eventrootpath == None:
             raise Exception("Event files not found.")
-        for eventpath in modified_eventrootpath.glob("*.arc"):
-            modified = False
-            filename = eventpath.parts[-1]
-            self.progress_callback(f"patching {filename}")
-            modified_eventpath = modified_eventrootpath / filename
-            eventarc = U8File.parse_u8(BytesIO(eventpath.read_bytes()))
-            # make sure to handle text files first for labels
-            for eventfilepath in sorted(
-                eventarc.get_all_paths(), key=lambda x: x[-1], reverse=True
-            ):
-                eventfilename = eventfilepath.split("/")[-1]
-                if eventfilename.endswith(".msbf"):
-                    parsedMsb = parseMSB(eventarc.get_file_data(eventfilepath))
-                    if self.event_patch:
-                        patchedMsb = self.event_patch(parsedMsb, eventfilename[:-5])
-                        if patchedMsb:
-                            eventarc.set_file_data(eventfilepath, buildMSB(patchedMsb))
-                            modified = True
-                elif eventfilename.endswith(".msbt"):
-                    parsedMsb = parseMSB(eventarc.get_file_data(eventfilepath))
-                    if self.event_text_patch:
-                        patchedMsb = self.event_text_patch(
-                            parsedMsb, eventfilename[:-5]
-                        )
-                        if patchedMsb:
-                            eventarc.set_file_data(eventfilepath, buildMSB(patchedMsb))
-                            modified = True
-            if modified:
-                write_bytes_create_dirs(modified_eventpath, eventarc.to_buffer())
-                # print(f'patched {filename}')
+        eventpaths = [
+            (eventpath, modified_eventrootpath)
+            for eventpath in sorted(modified_eventrootpath.glob("*.arc"))
+        ]
+        for action in self.map_files(patch_event_worker, self.patch_event, eventpaths):
+            self.progress_callback(action)
+        if self.patch_cache_path is not None:
+            self.trim_patch_cache()
 
         self.progress_callback("patching ObjectPack...")
         # patch object pack
@@ -555,7 +453,7 @@ class AllPatcher:
                 / "ObjectPack.arc.LZ"
             ).read_bytes()
         )
-        object_arc = U8File.parse_u8(BytesIO(objpack_data))
+        object_arc = U8File.parse_u8_buffer(objpack_data)
         objpack_modified = False
         patched_arcs = set()
         for oarc in self.objpackoarcadd:
@@ -590,3 +488,300 @@ class AllPatcher:
             )
 
         shutil.rmtree(self.tmp_dir)
+
+    def map_files(self, worker, patch_func, args):
+        """
+        Applies [patch_func] to every element of [args], on a process pool if
+        self.processes allows it, yielding the progress action of every file as
+        soon as it is done. The files must be independent of each other, since
+        the patch callbacks of every worker work on their own copy of the state
+        """
+        if self.processes <= 1 or len(args) <= 1:
+            for arg in args:
+                yield patch_func(arg)
+            return
+
+        with multiprocessing.Pool(
+            min(self.processes, len(args)), init_patch_worker, (self,)
+        ) as pool:
+            yield from pool.imap_unordered(worker, args)
+
+    def patch_stage(self, stagepath: Path) -> str:
+        match = STAGE_REGEX.match(stagepath.parts[-1])
+        stage = match[1]
+        layer = int(match[2])
+        modified_stagepath = (
+            self.modified_extract_path
+            / "DATA"
+            / "files"
+            / "Stage"
+            / f"{stage}"
+            / f"{stage}_stg_l{layer}.arc.LZ"
+        )
+        stagefiledata = stagepath.read_bytes()
+        cache_key = None
+        if self.patch_cache_path is not None and self.stage_patch_key is not None:
+            cache_key = self.get_stage_cache_key(stagefiledata, stage, layer)
+            if self.copy_from_patch_cache(cache_key, modified_stagepath):
+                return f"patching {stage} l{layer}"
+
+        modified = False
+        should_be_copied = False
+        # patch arcs with gamepatches
+        patch_arcs = self.stage_oarc_patch.get((stage, layer), [])
+        # remove some arcs if necessary
+        remove_arcs = set(self.stage_oarc_delete.get((stage, layer), []))
+        # add additional arcs if needed
+        additional_arcs = set(self.stage_oarc_add.get((stage, layer), []))
+        if (
+            patch_arcs
+            or remove_arcs
+            or additional_arcs
+            or layer == 0
+            or self.arc_replacements
+        ):
+            # only decompress and extract files, if needed
+            stagedata = nlzss11.decompress(stagefiledata)
+            stageu8 = U8File.parse_u8_buffer(stagedata)
+
+            # remove arcs that are already added on layer 0
+            if layer != 0:
+                additional_arcs = additional_arcs - (
+                    set(self.stage_oarc_add.get((stage, 0), [])) - set(("dummy",))
+                )
+            remove_arcs = remove_arcs - additional_arcs
+            for arc in remove_arcs:
+                stageu8.delete_file(f"oarc/{arc}.arc")
+                modified = True
+            patched_arcs = set()
+            for arc in additional_arcs:
+                if arc == "dummy":
+                    # dummy arcs inserted to make sure this layer gets patched
+                    should_be_copied = True
+                    continue
+                arcname = f"{arc}.arc"
+                oarc_path = self.arc_replacements.get(arcname) or (
+                    self.oarc_cache_path / arcname
+                )
+                stageu8.add_file_data(f"oarc/{arcname}", oarc_path.read_bytes())
+                patched_arcs.add(arcname)
+                modified = True
+
+            if patch_arcs:
+                for path in stageu8.get_all_paths():
+                    if match := OARC_ARC_REGEX.match(path):
+                        arc = match.group("name")
+                        patches = list(patch for patch in patch_arcs if patch[0] == arc)
+                        if patches:
+                            arcdata = stageu8.get_file_view(path)
+                            oarc: U8File = U8File.parse_u8_buffer(arcdata)
+                            for patch in patches:
+                                if new_arc := patch[1](stage, layer, arc, oarc):
+                                    oarc = new_arc
+                                    modified = True
+
+                            if modified:
+                                patched_arcs.add(arc)
+                                stageu8.set_file_data(path, oarc.to_buffer())
+
+            if self.arc_replacements:
+                for path in stageu8.get_all_paths():
+                    if match := OARC_ARC_REGEX.match(path):
+                        arc = match.group("name")
+                        if arc in patched_arcs:
+                            continue
+                        if replacement := self.arc_replacements.get(arc):
+                            stageu8.set_file_data(path, replacement.read_bytes())
+                            patched_arcs.add(arc)
+                            modified = True
+            if layer == 0:
+                stagebzs = parseBzs(stageu8.get_file_data("dat/stage.bzs"))
+                # patch stage
+                if self.bzs_patch or self.room_brres_patch:
+                    if self.bzs_patch:
+                        newstagebzs = self.bzs_patch(stagebzs, stage, None)
+                        if newstagebzs is not None:
+                            stageu8.set_file_data(
+                                "dat/stage.bzs", buildBzs(newstagebzs)
+                            )
+                            modified = True
+
+                    # patch rooms
+                    room_path_matches = (
+                        ROOM_REGEX.match(x) for x in stageu8.get_all_paths()
+                    )
+                    room_path_matches = (x for x in room_path_matches if not x is None)
+                    for room_path_match in room_path_matches:
+                        roomid = int(room_path_match.group("roomid"))
+                        roomdata = stageu8.get_file_view(room_path_match.group(0))
+                        roomarc = U8File.parse_u8_buffer(roomdata)
+
+                        if self.bzs_patch:
+                            roombzs = parseBzs(roomarc.get_file_data("dat/room.bzs"))
+                            roombzs = self.bzs_patch(roombzs, stage, roomid)
+                            if roombzs is not None:
+                                roomarc.set_file_data("dat/room.bzs", buildBzs(roombzs))
+                                stageu8.set_file_data(
+                                    room_path_match.group(0), roomarc.to_buffer()
+                                )
+                                modified = True
+                        if self.room_brres_patch:
+                            roombrres = BRRES.parse_brres(
+                                BytesIO(roomarc.get_file_view("g3d/room.brres"))
+                            )
+                            roombrres = self.room_brres_patch(roombrres, stage, roomid)
+                            if roombrres is not None:
+                                roomarc.set_file_data(
+                                    "g3d/room.brres", roombrres.to_buffer().read()
+                                )
+                                stageu8.set_file_data(
+                                    room_path_match.group(0), roomarc.to_buffer()
+                                )
+                                modified = True
+                # check if zev.dat can be patched
+                zev_path = self.assets_path / f"{stage}zev.dat"
+                if zev_path.is_file():
+                    zev_data = zev_path.read_bytes()
+                    stageu8.set_file_data("dat/zev.dat", zev_data)
+
+        # repack u8 and compress it if modified
+        if modified:
+            stagedata = nlzss11.compress(stageu8.to_buffer())
+            write_bytes_create_dirs(modified_stagepath, stagedata)
+            self.write_patch_cache(cache_key, stagedata)
+            # print(f'patched {stage} l{layer}')
+        elif self.copy_unmodified or layer == 0 or should_be_copied:
+            # always copy layer 0 because it contains the stage definitions
+            shutil.copy(stagepath, modified_stagepath)
+            # print(f"copied {stage} l{layer}")
+
+        return f"patching {stage} l{layer}"
+
+    def patch_event(self, args) -> str:
+        eventpath, modified_eventrootpath = args
+        modified = False
+        filename = eventpath.parts[-1]
+        modified_eventpath = modified_eventrootpath / filename
+        eventfiledata = eventpath.read_bytes()
+        eventarc = U8File.parse_u8_buffer(eventfiledata)
+        cache_key = None
+        if self.patch_cache_path is not None and self.event_patch_key is not None:
+            eventfilenames = sorted(
+                eventfilepath.split("/")[-1][:-5]
+                for eventfilepath in eventarc.get_all_paths()
+                if eventfilepath.endswith((".msbf", ".msbt"))
+            )
+            if (patch_key := self.event_patch_key(eventfilenames)) is not None:
+                cache_key = self.get_cache_key(eventfiledata, patch_key)
+            if self.copy_from_patch_cache(cache_key, modified_eventpath):
+                return f"patching {filename}"
+        # make sure to handle text files first for labels
+        for eventfilepath in sorted(
+            eventarc.get_all_paths(), key=lambda x: x[-1], reverse=True
+        ):
+            eventfilename = eventfilepath.split("/")[-1]
+            if eventfilename.endswith(".msbf"):
+                parsedMsb = parseMSB(eventarc.get_file_data(eventfilepath))
+                if self.event_patch:
+                    patchedMsb = self.event_patch(parsedMsb, eventfilename[:-5])
+                    if patchedMsb:
+                        eventarc.set_file_data(eventfilepath, buildMSB(patchedMsb))
+                        modified = True
+            elif eventfilename.endswith(".msbt"):
+                parsedMsb = parseMSB(eventarc.get_file_data(eventfilepath))
+                if self.event_text_patch:
+                    patchedMsb = self.event_text_patch(parsedMsb, eventfilename[:-5])
+                    if patchedMsb:
+                        eventarc.set_file_data(eventfilepath, buildMSB(patchedMsb))
+                        modified = True
+        if modified:
+            eventdata = eventarc.to_buffer()
+            write_bytes_create_dirs(modified_eventpath, eventdata)
+            self.write_patch_cache(cache_key, eventdata)
+            # print(f'patched {filename}')
+
+        return f"patching {filename}"
+
+    def get_stage_cache_key(
+        self, stagefiledata: bytes, stage: str, layer: int
+    ) -> Optional[str]:
+        oarc_patches = [
+            (patch[0], patch[2])
+            for patch in self.stage_oarc_patch.get((stage, layer), [])
+        ]
+        if any(key is None for _, key in oarc_patches):
+            return None
+        if (stage_patch_key := self.stage_patch_key(stage)) is None:
+            return None
+        zev_path = self.assets_path / f"{stage}zev.dat"
+        zev_hash = (
+            hashlib.sha256(zev_path.read_bytes()).hexdigest()
+            if layer == 0 and zev_path.is_file()
+            else None
+        )
+        return self.get_cache_key(
+            stagefiledata,
+            json.dumps(
+                [
+                    sorted(self.stage_oarc_add.get((stage, layer), [])),
+                    sorted(self.stage_oarc_add.get((stage, 0), [])),
+                    sorted(self.stage_oarc_delete.get((stage, layer), [])),
+                    oarc_patches,
+                    zev_hash,
+                    self.arc_replacements_key,
+                    stage_patch_key,
+                ]
+            ),
+        )
+
+    def get_cache_key(self, filedata: bytes, patch_key: str) -> str:
+        key = hashlib.sha256()
+        key.update(f"{PATCH_CACHE_VERSION} {VERSION}".encode())
+        key.update(hashlib.sha256(filedata).digest())
+        key.update(patch_key.encode())
+        return key.hexdigest()
+
+    def copy_from_patch_cache(self, cache_key: Optional[str], path: Path) -> bool:
+        if cache_key is None:
+            return False
+        cached_path = self.patch_cache_path / cache_key
+        if not cached_path.is_file():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy(cached_path, path)
+        # the modification time orders the entries by their last use
+        os.utime(cached_path)
+        return True
+
+    def write_patch_cache(self, cache_key: Optional[str], data: bytes):
+        if cache_key is None:
+            return
+        cached_path = self.patch_cache_path / cache_key
+        tmp_path = cached_path.with_name(f"{cached_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, cached_path)
+
+    def trim_patch_cache(self):
+        """Removes the least recently used files until the cache fits in its size"""
+        entries = []
+        for path in self.patch_cache_path.iterdir():
+            if path.suffix == ".tmp":
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.patch_cache_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+
+    def __getstate__(self):
+        # the progress callback may not be picklable, workers report through their return values
+        state = self.__dict__.copy()
+        del state["progress_callback"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.progress_callback = lambda action: None
@@ -5,33 +5,131 @@ from typing import NewType
 from collections import OrderedDict
 import struct
 
-from .utils import unpack, toStr, toBytes
+from .utils import toStr, toBytes
 
 nodestruct = ">4shhi"
 nodestructnames = "name count ff offset"
 
+NODE_STRUCT = struct.Struct(nodestruct)
+LAYER_STRUCT = struct.Struct(">hhi")
+NAME_OFFSET_STRUCT = struct.Struct(">H")
+RMPL_STRUCT = struct.Struct(">BBH")
+
 ParsedBzs = NewType("ParsedBzs", OrderedDict)
 
 
+class RawSection:
+    """A section that hasn't been parsed, kept as its original bytes"""
+
+    __slots__ = ("objtype", "count", "data")
+
+    def __init__(self, objtype: str, count: int, data: memoryview):
+        self.objtype = objtype
+        self.count = count
+        self.data = data
+
+    def parse(self):
+        return parseObj(self.objtype, self.count, bytes(self.data))
+
+    def __repr__(self):
+        return f"RawSection({self.objtype!r}, {self.count}, {len(self.data)} bytes)"
+
+
+class LazyNode(OrderedDict):
+    """
+    A V001 node, its sections are only parsed when they are first accessed.
+    Sections that were never accessed are built from their original bytes
+    """
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, RawSection):
+            value = value.parse()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def raw_items(self):
+        """Items without parsing the sections, unparsed ones are RawSection"""
+        return super().items()
+
+
+def align4(size: int) -> int:
+    return (size + 3) & ~3
+
+
+def section_size(objtype: str, quantity: int, data: memoryview) -> int:
+    """Size of a section as it would be built, not counting its padding"""
+    if objtype == "V001":
+        size = quantity * 12
+        for i in range(quantity):
+            addr = i * 12
+            name, count, ff, offset = NODE_STRUCT.unpack_from(data, addr)
+            start = addr + offset
+            child_size = section_size(name.decode("ascii"), count, data[start:])
+            size = max(size, align4(start + child_size))
+        return size
+    elif objtype == "LAY ":
+        size = quantity * 8
+        for i in range(quantity):
+            addr = i * 8
+            count, ff, offset = LAYER_STRUCT.unpack_from(data, addr)
+            if count != 0:
+                start = addr + offset
+                child_size = section_size("V001", count, data[start:])
+                size = max(size, align4(start + child_size))
+        return size
+    elif objtype in ("OBJN", "ARCN"):
+        size = quantity * 2
+        if quantity:
+            # the end of the string placed last
+            end = max(
+                NAME_OFFSET_STRUCT.unpack_from(data, 2 * i)[0] for i in range(quantity)
+            )
+            while data[end] != 0:
+                end += 1
+            size = max(size, end + 1)
+        return size
+    elif objtype == "RMPL":
+        size = quantity * 4
+        for i in range(quantity):
+            _, count, addr = RMPL_STRUCT.unpack_from(data, 4 * i)
+            size = max(size, 4 * i + addr + 2 * count)
+        return size
+    else:
+        return quantity * objectlayouts[objtype][1].size
+
+
 def parseBzs(data: bytes) -> ParsedBzs:
-    name, count, ff, offset = struct.unpack(">4shhi", data[:12])
+    name, count, ff, offset = NODE_STRUCT.unpack_from(data)
     assert ff == -1
     name = name.decode("ascii")
-    return parseObj(name, count, data[offset:])
+    return parseObj(name, count, memoryview(data)[offset:])
 
 
 def parseObj(objtype, quantity, data):
     if objtype == "V001":
-        # root
-        parsed = OrderedDict()
+        # root, its sections are parsed lazily
+        parsed = LazyNode()
+        data = memoryview(data)
         for i in range(quantity):
             addr = i * 12
-            name, count, ff, offset = struct.unpack(">4shhi", data[addr : addr + 12])
+            name, count, ff, offset = NODE_STRUCT.unpack_from(data, addr)
             assert ff == -1
             name = name.decode("ascii")
-            parsed[name] = parseObj(name, count, data[addr + offset :])
-            # if name != 'LAY ':
-            #    parsed[name]=len(parsed[name])
+            section = data[addr + offset :]
+            size = section_size(name, count, section)
+            parsed[name] = RawSection(name, count, section[:size])
         return parsed
     elif objtype == "LAY ":
         # different layers of the room (always 29 of them)
@@ -39,7 +137,7 @@ def parseObj(objtype, quantity, data):
         parsed = OrderedDict()
         for i in range(quantity):
             addr = i * 8
-            count, ff, offset = struct.unpack(">hhi", data[addr : addr + 8])
+            count, ff, offset = LAYER_STRUCT.unpack_from(data, addr)
             if count == 0:
                 parsed["l%d" % i] = OrderedDict()
             else:
@@ -49,7 +147,7 @@ def parseObj(objtype, quantity, data):
     elif objtype in ("OBJN", "ARCN"):
         parsed = []
         for i in range(quantity):
-            addr = data[2 * i] * 0x100 + data[2 * i + 1]
+            (addr,) = NAME_OFFSET_STRUCT.unpack_from(data, 2 * i)
             name = toStr(data[addr:])
             parsed.append(name)
         return parsed
@@ -57,9 +155,7 @@ def parseObj(objtype, quantity, data):
         parsed = OrderedDict()
         for i in range(quantity):
             rmpldata = data[4 * i :]
-            rmpl_id = rmpldata[0]
-            count = rmpldata[1]
-            addr = rmpldata[2] * 0x100 + rmpldata[3]
+            rmpl_id, count, addr = RMPL_STRUCT.unpack_from(rmpldata)
             parsed[rmpl_id] = []
             for j in range(count):
                 parsed[rmpl_id].append(rmpldata[addr + 2 * j : addr + 2 * j + 2])
@@ -68,11 +164,11 @@ def parseObj(objtype, quantity, data):
     else:
         # objects with quantities
         parsed = []
-        structnames, structdef, size = objectstructs[objtype]
-        for i in range(quantity):
-            item = data[size * i : size * (i + 1)]
-            unpacked = unpack(structnames, structdef, item)
-            if "name" in unpacked.keys():
+        structnames, layout = objectlayouts[objtype]
+        hasname = "name" in structnames
+        for values in layout.iter_unpack(data[: layout.size * quantity]):
+            unpacked = dict(zip(structnames, values))
+            if hasname:
                 unpacked["name"] = toStr(unpacked["name"])
             parsed.append(unpacked)
 
@@ -176,86 +272,130 @@ namelengths = {
 }
 
 
-def buildBzs(root: ParsedBzs) -> bytes:
-    count, odata = buildObj("V001", root)
-    data = struct.pack(nodestruct, b"V001", count, -1, 12) + odata
+objectlayouts = {
+    objtype: (tuple(structnames.split()), struct.Struct(structdef))
+    for objtype, (structnames, structdef, size) in objectstructs.items()
+}
+
 
-    # padding
-    pad = 32 - (len(data) % 32)
-    if pad == 32:
-        pad = 0
-    data += b"\xFF" * pad
+def buildBzs(root: ParsedBzs) -> bytearray:
+    size = 12 + objSize("V001", root)
+    # padding to 32, every byte not written stays 0xFF
+    data = bytearray(b"\xFF") * ((size + 31) & ~31)
+    count, _ = writeObj("V001", root, data, 12)
+    NODE_STRUCT.pack_into(data, 0, b"V001", count, -1, 12)
     return data
 
 
-def buildObj(objtype, objdata) -> (int, bytes):  # number of elements, bytes of body
+def objSize(objtype, objdata) -> int:
+    """Size of the body of an object, not counting its padding"""
     if objtype == "V001":
-        assert type(objdata) == OrderedDict
-        offset = len(objdata) * 12
-        body = b""
-        headerbytes = b""
-        for typ, obj in objdata.items():
-            count, data = buildObj(typ, obj)
-            # pad to 4
-            pad = (4 - (len(data) % 4)) * b"\xFF"
-            if len(pad) == 4:
-                pad = b""
-            headerbytes += struct.pack(
-                nodestruct,
-                typ.encode("ASCII"),
-                count,
-                -1,
-                len(body) - len(headerbytes) + offset,
+        if isinstance(objdata, LazyNode):
+            items = objdata.raw_items()
+        else:
+            items = objdata.items()
+        size = len(objdata) * 12
+        for typ, obj in items:
+            if isinstance(obj, RawSection):
+                size += align4(len(obj.data))
+            else:
+                size += align4(objSize(typ, obj))
+        return size
+    elif objtype == "LAY ":
+        size = 29 * 8
+        for layer in objdata.values():
+            if layer:
+                size += align4(objSize("V001", layer))
+        return size
+    elif objtype in ("OBJN", "ARCN"):
+        return sum(2 + len(s.encode("ASCII")) + 1 for s in objdata)
+    elif objtype == "RMPL":
+        return sum(4 + sum(len(x) for x in s) for s in objdata.values())
+    else:
+        return len(objdata) * objectlayouts[objtype][1].size
+
+
+def writeObj(objtype, objdata, data: bytearray, offset: int) -> (int, int):
+    """
+    Writes the body of an object at offset in data, which must have been
+    allocated with objSize, padding included.
+    Returns the number of elements and the end of the body
+    """
+    if objtype == "V001":
+        assert isinstance(objdata, OrderedDict)
+        header = offset
+        body = offset + len(objdata) * 12
+        if isinstance(objdata, LazyNode):
+            items = objdata.raw_items()
+        else:
+            items = objdata.items()
+        for typ, obj in items:
+            if isinstance(obj, RawSection):
+                count, end = obj.count, body + len(obj.data)
+                data[body:end] = obj.data
+            else:
+                count, end = writeObj(typ, obj, data, body)
+            NODE_STRUCT.pack_into(
+                data, header, typ.encode("ASCII"), count, -1, body - header
             )
-            body += data + pad
-            # body+=(16-(len(body)%16))*b'\xFF'
-        return (len(objdata), headerbytes + body)
+            header += 12
+            # pad to 4
+            body = align4(end)
+        return (len(objdata), body)
     elif objtype == "LAY ":
         assert type(objdata) == OrderedDict
         assert len(objdata) == 29
-        offset = 29 * 8
-        body = b""
-        headerbytes = b""
+        header = offset
+        body = offset + 29 * 8
         for layer in objdata.values():
             if not layer:
-                headerbytes += struct.pack(">hhi", 0, -1, 0)
+                LAYER_STRUCT.pack_into(data, header, 0, -1, 0)
             else:
-                count, data = buildObj("V001", layer)
-                dataoffset = len(body) - len(headerbytes) + offset
+                count, end = writeObj("V001", layer, data, body)
+                LAYER_STRUCT.pack_into(data, header, count, -1, body - header)
                 # pad to 4
-                pad = (4 - (len(data) % 4)) * b"\xFF"
-                if len(pad) == 4:
-                    pad = b""
-                headerbytes += struct.pack(">hhi", count, -1, dataoffset)
-                body += data + pad
-        return (29, headerbytes + body)
+                body = align4(end)
+            header += 8
+        return (29, body)
 
     elif objtype in ("OBJN", "ARCN"):
         assert type(objdata) == list
-        offset = len(objdata) * 2
-        sbytes = b""
-        headerbytes = b""
+        header = offset
+        body = offset + len(objdata) * 2
         for s in objdata:
-            headerbytes += struct.pack(">H", len(sbytes) + offset)
-            sbytes += s.encode("ASCII") + b"\x00"
-        return (len(objdata), headerbytes + sbytes)
+            NAME_OFFSET_STRUCT.pack_into(data, header, body - offset)
+            header += 2
+            encoded = s.encode("ASCII")
+            end = body + len(encoded)
+            data[body:end] = encoded
+            data[end] = 0
+            body = end + 1
+        return (len(objdata), body)
     elif objtype == "RMPL":
         assert type(objdata) == OrderedDict
-        offset = len(objdata) * 4
-        body = b""
-        headerbytes = b""
+        header = offset
+        body = offset + len(objdata) * 4
         for i, s in objdata.items():
-            headerbytes += struct.pack(
-                ">BBH", i, len(s), len(body) + offset - len(headerbytes)
-            )
-            body += b"".join(s)
-        return (len(objdata), headerbytes + body)
+            RMPL_STRUCT.pack_into(data, header, i, len(s), body - header)
+            header += 4
+            for value in s:
+                data[body : body + len(value)] = value
+                body += len(value)
+        return (len(objdata), body)
 
     else:
         assert type(objdata) == list
+        _, layout = objectlayouts[objtype]
+        pack_into = layout.pack_into
         for obj in objdata:
             if "name" in obj:
-                obj["name"] = toBytes(obj["name"], namelengths[objtype])
-        _, structdef, _ = objectstructs[objtype]
-        mapped = (struct.pack(structdef, *obj.values()) for obj in objdata)
-        return (len(objdata), b"".join(mapped))
+                namelength = namelengths[objtype]
+                values = (
+                    toBytes(value, namelength) if key == "name" else value
+                    for key, value in obj.items()
+                )
+                pack_into(data, offset, *values)
+            else:
+                pack_into(data, offset, *obj.values())
+            offset += layout.size
+        return (len(objdata), offset)
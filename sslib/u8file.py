@@ -1,17 +1,20 @@
 from io import BufferedIOBase, BytesIO
-from .fs_helpers import (
-    read_u8,
-    read_u24,
-    read_u32,
-    read_str_until_null_character,
-    write_u24,
-    write_u32,
-)
 from collections import OrderedDict
-from typing import Tuple, List, Optional
+from pathlib import Path
+from typing import Dict, Tuple, List, Optional
+import mmap
 import struct
 
 MAGIC_HEADER = b"U\xaa8-"
+# magic, first node offset, size of the nodes and strings, data offset
+HEADER_STRUCT = struct.Struct(">4sIII")
+# node type and string offset, then data offset and length for files,
+# or parent index and next parent index for directories
+NODE_STRUCT = struct.Struct(">III")
+
+
+def _align32(offset: int) -> int:
+    return (offset + 31) & ~31
 
 
 class InvalidU8File(Exception):
@@ -26,10 +29,7 @@ class Node:
     def set_name(self, name):
         self.name = name
 
-    def write_header_to(self, buffer):
-        raise NotImplementedError
-
-    def write_data_to(self, u8file, buffer):
+    def pack_header_into(self, buffer, offset):
         raise NotImplementedError
 
 
@@ -41,11 +41,14 @@ class DirNode(Node):
         self.next_parent_index = next_parent_index
         self.new_next_parent_index = next_parent_index
 
-    def write_header_to(self, buffer):
-        buffer.write(b"\x01")
-        write_u24(buffer, None, self.string_offset)
-        write_u32(buffer, None, self.new_parent_index)
-        write_u32(buffer, None, self.new_next_parent_index)
+    def pack_header_into(self, buffer, offset):
+        NODE_STRUCT.pack_into(
+            buffer,
+            offset,
+            0x01000000 | self.string_offset,
+            self.new_parent_index,
+            self.new_next_parent_index,
+        )
 
 
 class FileNode(Node):
@@ -56,19 +59,10 @@ class FileNode(Node):
         self.data_length = data_length
         self.data_overwrite = None
 
-    def write_header_to(self, buffer):
-        buffer.write(b"\x00")
-        write_u24(buffer, None, self.string_offset)
-        write_u32(buffer, None, self.new_data_offset)
-        write_u32(buffer, None, self.get_length())
-
-    def write_data_to(self, u8file, buffer):
-        buffer.seek(self.new_data_offset)
-        if self.data_overwrite:
-            buffer.write(self.data_overwrite)
-        else:
-            u8file.data.seek(self.data_offset)
-            buffer.write(u8file.data.read(self.data_length))
+    def pack_header_into(self, buffer, offset):
+        NODE_STRUCT.pack_into(
+            buffer, offset, self.string_offset, self.new_data_offset, self.get_length()
+        )
 
     def get_length(self):
         if self.data_overwrite:
@@ -83,8 +77,14 @@ class FileNode(Node):
         if self.data_overwrite:
             return self.data_overwrite
         else:
-            u8file.data.seek(self.data_offset)
-            return u8file.data.read(self.data_length)
+            return bytes(self.get_view(u8file))
+
+    def get_view(self, u8file):
+        """Same as get_data, but without copying the original content of the file"""
+        if self.data_overwrite:
+            return self.data_overwrite
+        else:
+            return u8file.data[self.data_offset : self.data_offset + self.data_length]
 
 
 class U8File:
@@ -93,152 +93,187 @@ class U8File:
 
     def __init__(
         self,
-        data: BufferedIOBase,
+        data: memoryview,
         nodes: List[Node],
     ):
         self.data = data
         self.nodes = nodes
+        # only files are ever added or deleted
+        self.dirs = [node for node in nodes if isinstance(node, DirNode)]
+        # path without leading '/' -> node, built on first lookup
+        self.paths: Optional[Dict[str, Node]] = None
 
     @staticmethod
     def parse_u8(data: BufferedIOBase):
-        nodes = []
+        if isinstance(data, BytesIO):
+            return U8File.parse_u8_buffer(data.getbuffer())
         data.seek(0)
-        if data.read(4) != MAGIC_HEADER:
+        return U8File.parse_u8_buffer(data.read())
+
+    @staticmethod
+    def parse_u8_file(path: Path):
+        """Parses a U8 file straight from disk, the file is mapped in memory instead of read"""
+        with path.open("rb") as f:
+            return U8File.parse_u8_buffer(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            )
+
+    @staticmethod
+    def parse_u8_buffer(buffer):
+        """
+        Parses a U8 file from any object supporting the buffer protocol.
+        The buffer is not copied, file contents are read from it when needed
+        """
+        data = memoryview(buffer)
+        if len(data) < U8File.FIRST_NODE_OFFSET + NODE_STRUCT.size:
+            raise InvalidU8File("Invalid magic header.")
+        magic, first_node_offset, all_node_size, _start_data_offset = (
+            HEADER_STRUCT.unpack_from(data)
+        )
+        if magic != MAGIC_HEADER:
             raise InvalidU8File("Invalid magic header.")
-        first_node_offset = struct.unpack(">I", data.read(4))[0]
         if first_node_offset != U8File.FIRST_NODE_OFFSET:
             raise InvalidU8File("Invalid first node offset.")
-        _all_node_size = struct.unpack(">I", data.read(4))[0]
-        _start_data_offset = struct.unpack(">I", data.read(4))[0]
         # read the first node, to figure out where the filenames start
         # should be a directory
-        data.seek(first_node_offset)
-        if data.read(1) != b"\x01":
-            raise InvalidU8File
         # the root node always starts at string offset 0
-        if read_u24(data, None) != 0:
-            raise InvalidU8File
         # it has no parent directory
-        if read_u32(data, None) != 0:
-            raise InvalidU8File
         # total count of nodes with 12 bytes each, after that the string
         # section starts
-        total_node_count = read_u32(data, None)
+        root_type_string, root_parent, total_node_count = NODE_STRUCT.unpack_from(
+            data, first_node_offset
+        )
+        if root_type_string != 0x01000000 or root_parent != 0:
+            raise InvalidU8File
         node = DirNode(0, 0, total_node_count)
         node.set_name("")
-        nodes.append(node)
+        nodes = [node]
         string_pool_base_offset = first_node_offset + total_node_count * 12
-        for i in range(1, total_node_count):
-            data.seek(first_node_offset + i * 12)
-            nodetype = data.read(1)
-            string_offset = read_u24(data, None)
-            if nodetype == b"\x00":
-                data_offset = read_u32(data, None)
-                data_length = read_u32(data, None)
-                node = FileNode(string_offset, data_offset, data_length)
-                node.set_name(
-                    read_str_until_null_character(
-                        data, string_pool_base_offset + string_offset
-                    )
-                )
-                nodes.append(node)
-            elif nodetype == b"\x01":
-                parent_index = read_u32(data, None)
-                next_parent_index = read_u32(data, None)
-                node = DirNode(string_offset, parent_index, next_parent_index)
-                node.set_name(
-                    read_str_until_null_character(
-                        data, string_pool_base_offset + string_offset
-                    )
-                )
-                nodes.append(node)
+        if len(data) < string_pool_base_offset:
+            raise InvalidU8File("Truncated node table.")
+        string_pool = bytes(
+            data[string_pool_base_offset : first_node_offset + all_node_size]
+        )
+        for type_string, value1, value2 in NODE_STRUCT.iter_unpack(
+            data[first_node_offset + 12 : string_pool_base_offset]
+        ):
+            nodetype = type_string >> 24
+            string_offset = type_string & 0xFFFFFF
+            if nodetype == 0:
+                node = FileNode(string_offset, value1, value2)
+            elif nodetype == 1:
+                node = DirNode(string_offset, value1, value2)
             else:
                 raise InvalidU8File(f"Unknown nodetype {nodetype}.")
+            string_end = string_pool.find(b"\0", string_offset)
+            if string_end < 0:
+                string_end = len(string_pool)
+            node.set_name(string_pool[string_offset:string_end].decode("shift_jis"))
+            nodes.append(node)
         return U8File(data, nodes)
 
-    def writeto(self, buffer: BufferedIOBase):
+    def _layout(self) -> Tuple[bytes, int]:
+        """
+        Assigns the string offset of every node and the data offset of every
+        file, returns the string pool and the size of the archive
+        """
         self.first_node_offset = 0x20
-        # do strings
-        string_pool_base_offset = self.first_node_offset + len(self.nodes) * 12
-        buffer.seek(string_pool_base_offset)
+        names = []
+        string_offset = 0
         for node in self.nodes:
-            node.string_offset = buffer.tell() - string_pool_base_offset
-            buffer.write(node.name.encode("ASCII"))
-            buffer.write(b"\x00")
-        self.all_node_size = buffer.tell() - self.first_node_offset
-        # padding before data section to 16
-        pad = 32 - (buffer.tell() % 32)
-        if pad == 32:
-            pad = 0
-        buffer.write(b"\x00" * pad)
-        self.data_offset = buffer.tell()
-
-        buffer.seek(0)
-        buffer.write(MAGIC_HEADER)
-        buffer.write(struct.pack(">I", self.first_node_offset))
-        buffer.write(struct.pack(">I", self.all_node_size))
-        buffer.write(struct.pack(">I", self.data_offset))
-        buffer.seek(self.first_node_offset)
-        cur_data_offset = self.data_offset
+            node.string_offset = string_offset
+            name = node.name.encode("ASCII") + b"\x00"
+            names.append(name)
+            string_offset += len(name)
+        string_pool = b"".join(names)
+        string_pool_base_offset = self.first_node_offset + len(self.nodes) * 12
+        self.all_node_size = (
+            string_pool_base_offset + len(string_pool) - self.first_node_offset
+        )
+        # padding before data section to 32
+        self.data_offset = _align32(string_pool_base_offset + len(string_pool))
 
-        for i, node in enumerate(self.nodes):
-            if node.node_type == b"\x00":
-                # todo modified/unmodified
+        # files are padded to 32, except the last one
+        size = self.data_offset
+        cur_data_offset = self.data_offset
+        for node in self.nodes:
+            if isinstance(node, FileNode):
                 node.new_data_offset = cur_data_offset
-                buffer.seek(cur_data_offset)
-                node.write_data_to(self, buffer)
-                cur_data_offset += node.get_length()
-                # pad to 32
-                pad = 32 - (buffer.tell() % 32)
-                if pad == 32:
-                    pad = 0
-                cur_data_offset += pad
-            buffer.seek(self.first_node_offset + i * 12)
-            node.write_header_to(buffer)
-
-        buffer.seek(cur_data_offset)
-        # final padding to 16
-        pad = 16 - (cur_data_offset % 16)
-        if pad == 16:
-            pad = 0
-        buffer.write(b"\x00" * pad)
+                if length := node.get_length():
+                    size = cur_data_offset + length
+                cur_data_offset = _align32(cur_data_offset + length)
+        return string_pool, size
+
+    def _write_headers(self, buffer, string_pool: bytes):
+        HEADER_STRUCT.pack_into(
+            buffer,
+            0,
+            MAGIC_HEADER,
+            self.first_node_offset,
+            self.all_node_size,
+            self.data_offset,
+        )
+        offset = self.first_node_offset
+        for node in self.nodes:
+            node.pack_header_into(buffer, offset)
+            offset += NODE_STRUCT.size
+        buffer[offset : offset + len(string_pool)] = string_pool
 
-    def to_buffer(self):
-        out = BytesIO()
-        self.writeto(out)
-        return out.getbuffer()
+    def writeto(self, buffer: BufferedIOBase):
+        """
+        Writes the archive sequentially, the contents of unmodified files
+        are written straight from the original buffer
+        """
+        string_pool, _ = self._layout()
+        headers = bytearray(self.data_offset)
+        self._write_headers(headers, string_pool)
+        buffer.write(headers)
+        position = self.data_offset
+        for node in self.nodes:
+            if isinstance(node, FileNode) and node.get_length():
+                buffer.write(b"\x00" * (node.new_data_offset - position))
+                view = node.get_view(self)
+                buffer.write(view)
+                position = node.new_data_offset + len(view)
 
-    def get_file(self, path: str):
-        index = self._get_file_index(path)
-        if index is None:
-            return None
-        else:
-            return self.nodes[index]
+    def to_buffer(self):
+        """
+        Builds the archive in a single preallocated buffer, the contents of
+        unmodified files are copied straight from the original buffer
+        """
+        string_pool, size = self._layout()
+        out = bytearray(size)
+        self._write_headers(out, string_pool)
+        for node in self.nodes:
+            if isinstance(node, FileNode):
+                view = node.get_view(self)
+                out[node.new_data_offset : node.new_data_offset + len(view)] = view
+        return memoryview(out)
 
-    def _get_file_index(self, path: str) -> int:
+    def get_paths(self) -> Dict[str, Node]:
         """
-        Returns the index of the file, if found
-        If the file isn't found, None is returned
+        Returns every node by its path without the leading '/', the dict
+        is kept up to date by add_file_data and delete_file
         """
-        total_nodes = self.nodes[0].new_next_parent_index
-        foundindex = 1
-        path = path.lstrip("/")
-        for part in path.split("/"):
-            currnode = self.nodes[foundindex]
-            if isinstance(currnode, DirNode):
-                while part != currnode.name:
-                    foundindex = currnode.new_next_parent_index
-                    if foundindex >= total_nodes:
-                        return None
-                    currnode = self.nodes[foundindex]
-                foundindex += 1
-            else:
-                while part != currnode.name:
-                    foundindex += 1
-                    if foundindex >= total_nodes:
-                        return None
-                    currnode = self.nodes[foundindex]
-        return foundindex
+        if self.paths is None:
+            self.paths = {}
+            # directory path and index of its end, for the current directories
+            dirs = [("", len(self.nodes))]
+            for index in range(1, len(self.nodes)):
+                while index >= dirs[-1][1]:
+                    dirs.pop()
+                node = self.nodes[index]
+                path = dirs[-1][0] + node.name
+                self.paths.setdefault(path, node)
+                if isinstance(node, DirNode):
+                    dirs.append((path + "/", node.new_next_parent_index))
+        return self.paths
+
+    def get_file(self, path: str) -> Optional[FileNode]:
+        node = self.get_paths().get(path.lstrip("/"))
+        if isinstance(node, FileNode):
+            return node
+        return None
 
     def get_file_data(self, path: str) -> Optional[bytes]:
         file = self.get_file(path)
@@ -246,6 +281,13 @@ class U8File:
             return None
         return file.get_data(self)
 
+    def get_file_view(self, path: str) -> Optional[memoryview]:
+        """Returns the content of the file without copying it, if found"""
+        file = self.get_file(path)
+        if not file:
+            return None
+        return file.get_view(self)
+
     def set_file_data(self, path: str, data: bytes):
         file = self.get_file(path)
         if not file:
@@ -259,52 +301,50 @@ class U8File:
             already_exists_file.set_data(data)
             return
         # can't add directories for now
+        path = path.lstrip("/")
+        dirname, _, name = path.rpartition("/")
+        directory = self.get_paths().get(dirname) if dirname else self.nodes[0]
+        if not isinstance(directory, DirNode):
+            raise Exception("Directory not found.")
         new_node = FileNode(
             -1,
             -1,
             -1,
         )
-        total_nodes = self.nodes[0].new_next_parent_index
-        foundindex = 1
-        for part in path.split("/"):
-            currnode = self.nodes[foundindex]
-            if isinstance(currnode, DirNode):
-                while part != currnode.name:
-                    foundindex = currnode.new_next_parent_index
-                    if foundindex >= total_nodes:
-                        break
-                    currnode = self.nodes[foundindex]
-                foundindex += 1
-            else:
-                while part < currnode.name:
-                    foundindex += 1
-                    if foundindex >= total_nodes:
-                        break
-                    currnode = self.nodes[foundindex]
-                new_node.set_name(part)
-        # found place to insert the new node in
+        new_node.set_name(name)
         new_node.set_data(data)
+        # the new file goes before the first node with a name not after its own
+        dirindex = self.nodes.index(directory)
+        foundindex = dirindex + 1
+        while foundindex < len(self.nodes) and name < self.nodes[foundindex].name:
+            foundindex += 1
         # fix all node references: if it's higer than index add one
-        for node in self.nodes:
-            if isinstance(node, DirNode):
-                if node.new_parent_index >= foundindex:
-                    node.new_parent_index += 1
-                if node.new_next_parent_index >= foundindex:
-                    node.new_next_parent_index += 1
+        self._shift_dirs(foundindex, 1)
         self.nodes.insert(foundindex, new_node)
+        if foundindex <= directory.new_next_parent_index and not any(
+            isinstance(node, DirNode) for node in self.nodes[dirindex + 1 : foundindex]
+        ):
+            self.paths[path] = new_node
+        else:
+            # it ended up in another directory, the index has to be rebuilt
+            self.paths = None
 
     def delete_file(self, path: str):
-        fileindex = self._get_file_index(path)
-        if fileindex is None:
+        file = self.get_file(path)
+        if file is None:
             return None
-        for node in self.nodes:
-            if isinstance(node, DirNode):
-                if node.new_parent_index >= fileindex:
-                    node.new_parent_index -= 1
-                if node.new_next_parent_index >= fileindex:
-                    node.new_next_parent_index -= 1
+        fileindex = self.nodes.index(file)
+        self._shift_dirs(fileindex, -1)
+        del self.paths[path.lstrip("/")]
         return self.nodes.pop(fileindex)
 
+    def _shift_dirs(self, index: int, delta: int):
+        for node in self.dirs:
+            if node.new_parent_index >= index:
+                node.new_parent_index += delta
+            if node.new_next_parent_index >= index:
+                node.new_next_parent_index += delta
+
     def get_all_paths(self, start=0) -> List[str]:
         """
         Returns a list of all paths in the ARC,
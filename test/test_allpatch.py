@@ -0,0 +1,108 @@
+from context import sslib
+from sslib.allpatch import AllPatcher, patch_stage_worker
+from sslib.u8file import DirNode, FileNode
+import nlzss11
+from io import BytesIO
+from pathlib import Path
+import os
+
+
+def make_u8(files, dirname=None):
+    nodes = [DirNode(0, 0, len(files) + 1 + (dirname is not None))]
+    if dirname is not None:
+        nodes.append(DirNode(0, 0, len(files) + 2))
+        nodes[-1].set_name(dirname)
+    nodes[0].set_name("")
+    for name, data in files.items():
+        node = FileNode(0, 0, 0)
+        node.set_name(name)
+        node.set_data(data)
+        nodes.append(node)
+    return bytes(sslib.U8File(memoryview(b""), nodes).to_buffer())
+
+
+def patch_oarc(stage, layer, arc, oarc):
+    oarc.add_file_data(f"{stage}.txt", f"{stage} l{layer} {arc}".encode())
+    return oarc
+
+
+def make_patcher(tmp_path, name, processes):
+    patcher = AllPatcher(
+        actual_extract_path=tmp_path / "actual",
+        modified_extract_path=tmp_path / name,
+        oarc_cache_path=tmp_path / "oarc",
+        arc_replacement_path=tmp_path / "replacements",
+        assets_path=tmp_path / "assets",
+        current_player_model_pack_name="Default",
+        current_loftwing_model_pack_name="Default",
+        copy_unmodified=False,
+        processes=processes,
+    )
+    for i in range(8):
+        stage = f"D{i:03}"
+        patcher.add_stage_oarc(stage, 1, ["Added"])
+        patcher.delete_stage_oarc(stage, 1, ["Removed"])
+        patcher.patch_stage_oarc(stage, 1, "Kept.arc", patch_oarc)
+    return patcher
+
+
+def test_map_files_processes(tmp_path):
+    stagepaths = []
+    for i in range(8):
+        stage = f"D{i:03}"
+        stagepath = tmp_path / "actual" / "DATA" / "files" / "Stage" / stage
+        stagepath.mkdir(parents=True)
+        stagepath /= f"{stage}_stg_l1.arc.LZ"
+        oarcs = {
+            "Kept.arc": make_u8({"data.bin": bytes(range(i * 16))}),
+            "Removed.arc": make_u8({}),
+        }
+        stagepath.write_bytes(nlzss11.compress(make_u8(oarcs, "oarc")))
+        stagepaths.append(stagepath)
+    (tmp_path / "oarc").mkdir()
+    (tmp_path / "oarc" / "Added.arc").write_bytes(make_u8({"added.bin": b"added"}))
+
+    outputs = []
+    for name, processes in (("single", 1), ("pool", 4)):
+        patcher = make_patcher(tmp_path, name, processes)
+        actions = patcher.map_files(patch_stage_worker, patcher.patch_stage, stagepaths)
+        assert sorted(actions) == [f"patching D{i:03} l1" for i in range(8)]
+        outputs.append(
+            {
+                path.relative_to(tmp_path / name): path.read_bytes()
+                for path in (tmp_path / name).rglob("*.LZ")
+            }
+        )
+
+    assert len(outputs[0]) == 8
+    assert outputs[0] == outputs[1]
+    stagepath = Path("DATA", "files", "Stage", "D000", "D000_stg_l1.arc.LZ")
+    stageu8 = sslib.U8File.parse_u8(BytesIO(nlzss11.decompress(outputs[0][stagepath])))
+    assert stageu8.get_file("oarc/Removed.arc") is None
+    assert stageu8.get_file("oarc/Added.arc") is not None
+    kept = sslib.U8File.parse_u8(BytesIO(stageu8.get_file_data("oarc/Kept.arc")))
+    assert kept.get_file_data("D000.txt") == b"D000 l1 Kept.arc"
+
+
+def test_patch_cache(tmp_path):
+    (tmp_path / "actual" / "DATA").mkdir(parents=True)
+    patcher = make_patcher(tmp_path, "modified", 1)
+    patcher.patch_cache_path = tmp_path / "cache"
+    patcher.patch_cache_path.mkdir()
+    patcher.patch_cache_size = 250
+    patcher.set_stage_patch_key(lambda stage: stage)
+    # the oarc patch of every stage has no key, so they can't be cached
+    assert patcher.get_stage_cache_key(b"", "D000", 1) is None
+    patcher.patch_stage_oarc("D100", 1, "Kept.arc", patch_oarc, key="kept")
+    assert patcher.get_stage_cache_key(b"", "D100", 1) is not None
+
+    for i, key in enumerate("abc"):
+        patcher.write_patch_cache(key, bytes(100))
+        os.utime(patcher.patch_cache_path / key, (i, i))
+    # using a file makes it the most recently used
+    assert patcher.copy_from_patch_cache("a", tmp_path / "modified" / "a")
+    patcher.trim_patch_cache()
+    assert sorted(path.name for path in patcher.patch_cache_path.iterdir()) == [
+        "a",
+        "c",
+    ]
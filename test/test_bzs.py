@@ -3,6 +3,8 @@ from test_utils import get_bzs_data, get_arc_data, ALL_STAGES, STAGEPATH
 import pytest
 from io import BytesIO
 import nlzss11
+from collections import OrderedDict
+from gamepatches import BzsIndex, get_entry_from_bzs
 
 
 @pytest.mark.parametrize("stage", ALL_STAGES)
@@ -23,3 +25,136 @@ def test_roundtrip(stage):
             "dat/room.bzs"
         )
         assert roomdata == sslib.buildBzs(sslib.parseBzs(roomdata))
+
+
+def make_bzs():
+    layers = OrderedDict((f"l{i}", OrderedDict()) for i in range(29))
+    layers["l1"] = OrderedDict(
+        [
+            (
+                "OBJ ",
+                [
+                    OrderedDict(
+                        params1=0xFFFFFFFF,
+                        params2=i,
+                        posx=1.5,
+                        posy=-2.0,
+                        posz=0.0,
+                        anglex=0,
+                        angley=0x4000,
+                        anglez=0,
+                        id=0xFC00 | i,
+                        name=name,
+                    )
+                    for i, name in enumerate(("Tbox", "Item"))
+                ],
+            ),
+            ("OBJN", ["Tbox", "Item"]),
+        ]
+    )
+    return OrderedDict(
+        [
+            ("FILE", [OrderedDict(unk=1, dummy=0)]),
+            ("LAY ", layers),
+            ("ARCN", ["Alink", "Bird"]),
+        ]
+    )
+
+
+def test_lazy_sections():
+    data = sslib.buildBzs(make_bzs())
+    # untouched sections are written back as is
+    assert data == sslib.buildBzs(sslib.parseBzs(data))
+
+    lazy = sslib.parseBzs(data)
+    lazy["LAY "]["l1"]["OBJ "][1]["params1"] = 0
+    eager = sslib.parseBzs(data)
+    for layer in eager["LAY "].values():
+        layer.items()
+    eager.items()
+    eager["LAY "]["l1"]["OBJ "][1]["params1"] = 0
+    built = sslib.buildBzs(lazy)
+    assert built == sslib.buildBzs(eager)
+    assert sslib.parseBzs(built)["LAY "]["l1"]["OBJ "][1]["params1"] == 0
+    assert sslib.parseBzs(built)["ARCN"] == ["Alink", "Bird"]
+
+
+def test_build_does_not_modify():
+    bzs = make_bzs()
+    data = sslib.buildBzs(bzs)
+    assert bzs["LAY "]["l1"]["OBJ "][0]["name"] == "Tbox"
+    assert sslib.buildBzs(bzs) == data
+    assert len(data) % 32 == 0
+
+
+def obj_def(id, layer=1, **kwargs):
+    return dict(objtype="OBJ", layer=layer, id=id, **kwargs)
+
+
+def test_bzs_index_ids():
+    bzs = sslib.parseBzs(sslib.buildBzs(make_bzs()))
+    index = BzsIndex(bzs)
+    tbox, item = bzs["LAY "]["l1"]["OBJ "]
+    # moving the object with the highest id doesn't lower the numbering
+    assert get_entry_from_bzs(index, obj_def(0xFC01), remove=True) is item
+    item["id"] = (item["id"] & ~0x3FF) | index.next_id()
+    index.add(2, "OBJ ", item)
+    assert item["id"] == 0xFC02
+    added = OrderedDict(tbox, id=0xFC00 | index.next_id())
+    index.add(1, "OBJ ", added)
+    assert added["id"] == 0xFC03
+
+    assert index.with_id(1, "OBJ ", 0xFC01) == []
+    assert index.with_id(2, "OBJ ", 0xFC02) == [item]
+    assert get_entry_from_bzs(index, obj_def(0xFC03)) is added
+    built = sslib.parseBzs(sslib.buildBzs(bzs))
+    assert [obj["id"] for obj in built["LAY "]["l1"]["OBJ "]] == [0xFC00, 0xFC03]
+    assert [obj["id"] for obj in built["LAY "]["l2"]["OBJ "]] == [0xFC02]
+
+
+def test_bzs_index_lookups():
+    bzs = sslib.parseBzs(sslib.buildBzs(make_bzs()))
+    index = BzsIndex(bzs)
+    tbox, item = bzs["LAY "]["l1"]["OBJ "]
+    assert index.with_name(1, "OBJ ", "Item") == [item]
+    assert index.with_id(1, "OBJ ", 0xFC00) == [tbox]
+
+    # the section is already indexed
+    other = OrderedDict(item, id=0xFC10)
+    index.add(1, "OBJ ", other)
+    assert index.with_name(1, "OBJ ", "Item") == [item, other]
+    index.remove(1, "OBJ ", item)
+    assert index.with_name(1, "OBJ ", "Item") == [other]
+    assert index.with_id(1, "OBJ ", 0xFC01) == []
+    assert index.with_id(1, "OBJ ", 0xFC10) == [other]
+    assert bzs["LAY "]["l1"]["OBJ "] == [tbox, other]
+
+    # by index, the object at that position is removed even if another is equal
+    copy = OrderedDict(tbox)
+    index.add(1, "OBJ ", copy)
+    objdef = dict(objtype="OBJ", layer=1, index=2)
+    assert get_entry_from_bzs(index, objdef, remove=True) is copy
+    assert bzs["LAY "]["l1"]["OBJ "] == [tbox, other]
+    assert index.with_id(1, "OBJ ", 0xFC00) == [tbox]
+    # duplicated or missing ids aren't found
+    index.add(1, "OBJ ", copy)
+    assert get_entry_from_bzs(index, obj_def(0xFC00)) is None
+    assert get_entry_from_bzs(index, obj_def(0xFC20)) is None
+
+
+def test_bzs_index_invalidate():
+    bzs = sslib.parseBzs(sslib.buildBzs(make_bzs()))
+    index = BzsIndex(bzs)
+    tbox, item = bzs["LAY "]["l1"]["OBJ "]
+    assert index.with_name(1, "OBJ ", "Tbox") == [tbox]
+    assert index.with_id(1, "OBJ ", 0xFC01) == [item]
+    # as an objpatch changing the id and the name does
+    index.invalidate(1, "OBJ ")
+    item["id"] = 0xFC05
+    item["name"] = "Tbox"
+    assert index.with_name(1, "OBJ ", "Tbox") == [tbox, item]
+    assert index.with_name(1, "OBJ ", "Item") == []
+    assert index.with_id(1, "OBJ ", 0xFC01) == []
+    assert get_entry_from_bzs(index, obj_def(0xFC05)) is item
+    # numbered from the ids before the patch
+    assert index.next_id() == 2
@@ -8,9 +8,26 @@ from options import Options
 from yaml_files import requirements, checks, hints, map_exits
 from logic.logic_input import Areas
 from logic.fill_algo_common import UserOutput
+from logic.logic import Logic
+from logic.fill_engine import FillEngine, RequirementTable, batch_fill
+from logic.inventory import EXTENDED_ITEM, EMPTY_INV, HINT_BYPASS_BIT, Inventory
+from logic.logic_expression import (
+    AndCombination,
+    DNFInventory,
+    InventoryAtom,
+    ThresholdDNFInventory,
+)
+from logic.constants import (
+    INVENTORY_ITEMS,
+    CLAWSHOTS,
+    DEMISE,
+    PROGRESSIVE_SWORD,
+    number,
+)
 
 import time
 import json
+import pickle
 
 areas = Areas(requirements, checks, hints, map_exits)
 useroutput = UserOutput(Exception, lambda s: None)
@@ -81,3 +98,254 @@ def test_barren():
         rando.logic.get_barren_regions()
         # with open(f'testlogs/log4_{i:02}.json','w') as f:
         #     json.dump(rando.logic.get_barren_regions(), f, indent=2)
+
+
+def naive_fill(requirements, inventory):
+    keep_going = True
+    while keep_going:
+        keep_going = False
+        for i in EXTENDED_ITEM.items():
+            if not inventory[i] and requirements[i].eval(inventory):
+                inventory |= i
+                keep_going = True
+    return inventory
+
+
+def test_fill_engine():
+    requirements = areas.requirements.copy()
+    engine = FillEngine()
+    start = Inventory({EXTENDED_ITEM[item] for item in INVENTORY_ITEMS})
+    for inventory in (EMPTY_INV, Inventory(number(PROGRESSIVE_SWORD, 0)), start):
+        assert engine.fill(requirements, inventory) == naive_fill(
+            requirements, inventory
+        )
+    requirements[EXTENDED_ITEM[CLAWSHOTS]] = DNFInventory(True)
+    assert engine.fill(requirements, start) == naive_fill(requirements, start)
+    # Retraction
+    for item in (CLAWSHOTS, number(PROGRESSIVE_SWORD, 0)):
+        requirements[EXTENDED_ITEM[CLAWSHOTS]] = DNFInventory()
+        start = start.remove(EXTENDED_ITEM[item])
+        assert engine.fill(requirements, start) == naive_fill(requirements, start)
+
+
+def test_shared_table_log():
+    requirements = areas.requirements.copy()
+    start = Inventory({EXTENDED_ITEM[item] for item in INVENTORY_ITEMS})
+    table = RequirementTable()
+    first, second = FillEngine(table), FillEngine(table)
+    first.fill(requirements, start)
+    second.fill(requirements, start)
+    assert not table.log
+
+    requirements[EXTENDED_ITEM[CLAWSHOTS]] = DNFInventory(True)
+    first.fill(requirements, start)
+    # kept until every engine has seen it
+    assert table.log == [EXTENDED_ITEM[CLAWSHOTS]]
+    assert second.fill(requirements, start) == naive_fill(requirements, start)
+    assert not table.log
+
+    requirements[EXTENDED_ITEM[CLAWSHOTS]] = DNFInventory()
+    del second
+    first.fill(requirements, start)
+    assert not table.log
+
+
+def test_table_copy():
+    requirements = areas.requirements.copy()
+    start = Inventory({EXTENDED_ITEM[item] for item in INVENTORY_ITEMS})
+    table = RequirementTable(requirements)
+    engine = FillEngine(table)
+    engine.fill(requirements, start)
+
+    copy = table.copy()
+    requirements[EXTENDED_ITEM[CLAWSHOTS]] = DNFInventory(True)
+    assert FillEngine(copy).fill(requirements, start) == naive_fill(requirements, start)
+    # the original table and its engines don't see the changes
+    assert not table.log
+    assert (
+        table.sources[EXTENDED_ITEM[CLAWSHOTS]]
+        is areas.requirements[EXTENDED_ITEM[CLAWSHOTS]]
+    )
+    assert engine.fill(areas.requirements, start) == naive_fill(
+        areas.requirements, start
+    )
+
+
+def test_batch_fill():
+    requirements = areas.requirements.copy()
+    start = Inventory({EXTENDED_ITEM[item] for item in INVENTORY_ITEMS})
+    inventories = [EMPTY_INV, start]
+    banned = [0, 0]
+    for item in (CLAWSHOTS, number(PROGRESSIVE_SWORD, 0), "Gust Bellows"):
+        inventories.append(start.remove(EXTENDED_ITEM[item]))
+        banned.append(1 << EXTENDED_ITEM[item])
+    fulls = batch_fill(RequirementTable(requirements), inventories, banned)
+    for inventory, banned_bits, full in zip(inventories, banned, fulls):
+        custom_requirements = requirements.copy()
+        for i in range(len(custom_requirements)):
+            if banned_bits >> i & 1:
+                custom_requirements[i] = DNFInventory(False)
+        assert full == naive_fill(custom_requirements, inventory)
+
+
+def test_threshold_atom():
+    swords = [EXTENDED_ITEM[number(PROGRESSIVE_SWORD, i)] for i in range(6)]
+    (conj,) = InventoryAtom(PROGRESSIVE_SWORD, 3).disjunction
+    (threshold_bit,) = conj.intset
+    threshold = areas.requirements[threshold_bit]
+    assert isinstance(threshold, ThresholdDNFInventory)
+    assert len(threshold.disjunction) == 20
+
+    requirements = areas.requirements.copy()
+    inventories = [Inventory(set(swords[:k])) for k in range(7)]
+    inventories.append(Inventory({swords[1], swords[4], swords[5]}))
+    engine = FillEngine()
+    fulls = batch_fill(RequirementTable(requirements), inventories)
+    for inventory, full in zip(inventories, fulls):
+        expected = naive_fill(requirements, inventory)
+        assert expected[threshold_bit] == (len(inventory.intset) >= 3)
+        assert engine.fill(requirements, inventory) == expected
+        assert full == expected
+
+
+def test_dnf_algebra():
+    a, b, c, d = (EXTENDED_ITEM(i) for i in range(4))
+    left = DNFInventory({Inventory({a}), Inventory({b, c})})
+    right = DNFInventory({Inventory({a, d}), Inventory({b}), Inventory({c, d})})
+    # {a, d} is absorbed by {a}, {b} absorbs {b, c}
+    assert set((left | right).disjunction) == {
+        Inventory({a}),
+        Inventory({b}),
+        Inventory({c, d}),
+    }
+    # {a, c, d}, {a, b, c, d} and {b, c, d} are absorbed
+    assert set(AndCombination.simplifyDNF([left, right]).disjunction) == {
+        Inventory({a, d}),
+        Inventory({a, b}),
+        Inventory({b, c}),
+    }
+    assert AndCombination.simplifyDNF([]).disjunction.keys() == {EMPTY_INV}
+    assert not AndCombination.simplifyDNF([left, DNFInventory()]).disjunction
+
+
+def test_inventory():
+    a, b, c = (EXTENDED_ITEM(i) for i in (3, 70, 200))
+    inventory = Inventory({c, a}) | b
+    assert list(inventory) == [a, b, c]
+    assert inventory.intset == {a, b, c}
+    assert (inventory - b).intset == {a, c}
+    assert inventory.remove(a) == Inventory({b, c})
+    assert Inventory({a}) <= inventory and not inventory <= Inventory({a})
+    assert inventory.count() == 3
+    assert pickle.loads(pickle.dumps(inventory)) == inventory
+
+
+def test_accessible_checks():
+    opts = Options()
+    opts.set_option("dry-run", True)
+    logic = Randomizer(areas, opts).rando.rando_algo.logic
+    logic.add_items(EXTENDED_ITEM[item] for item in INVENTORY_ITEMS)
+    for placement_limit in ("", "\\Skyview", "\\Skyloft\\Central Skyloft"):
+        checks = list(
+            dict.fromkeys(logic.explore(areas.checks, areas[placement_limit]))
+        )
+        accessible = [
+            loc
+            for loc in checks
+            if logic.full_inventory[EXTENDED_ITEM[loc]]
+            and loc not in logic.fixed_locations
+        ]
+        assert logic.accessible_checks(placement_limit) == accessible
+        assert logic.accessible_empty_checks(placement_limit) == [
+            loc for loc in accessible if loc not in logic.placement.locations
+        ]
+
+
+def test_replace_item():
+    opts = Options()
+    opts.set_option("dry-run", True)
+    logic = Randomizer(areas, opts).rando.rando_algo.logic
+
+    item, last = [
+        item
+        for item in INVENTORY_ITEMS
+        if item not in logic.placement.items
+        and item not in logic.placement.item_placement_limit
+    ][:2]
+    # a check the starting items reach, so that the frees simplify what item unlocks
+    free = Logic.fill_inventory(list(logic.requirements), logic.frees)
+    first = next(
+        check for check in logic.accessible_empty_checks() if free[EXTENDED_ITEM[check]]
+    )
+    logic.remove_item(EXTENDED_ITEM[item])
+    logic.place_item(first, item)
+    assert len(logic.free_simplified) > 1
+    assert logic.replace_item(first, last) == item
+    assert logic.placement.locations[first] == last
+    assert item not in logic.placement.items
+    # what replace_item relies on to restore the requirements
+    assert {
+        i
+        for i, (req, backup) in enumerate(
+            zip(logic.requirements, logic.backup_requirements)
+        )
+        if req is not backup
+    } <= logic.free_simplified
+    assert logic.full_inventory == Logic.fill_inventory(
+        list(logic.backup_requirements), logic.inventory
+    )
+
+
+def naive_spheres(logic):
+    spheres = []
+    inventory = logic.inventory | HINT_BYPASS_BIT
+    found = inventory
+    usefuls = logic.get_useful_items()
+    while True:
+        sphere = []
+        keep_going = True
+        while keep_going:
+            keep_going = False
+            for i in EXTENDED_ITEM.items():
+                if not found[i] and logic.backup_requirements[i].eval(inventory):
+                    keep_going = True
+                    found |= i
+                    if (item := EXTENDED_ITEM.get_item_name(i)) in usefuls:
+                        sphere.append(logic.placement.items[item])
+                    elif i == EXTENDED_ITEM[logic.short_to_full(DEMISE)]:
+                        sphere.append(DEMISE)
+                    else:
+                        inventory |= i
+        inventory = found
+        if not sphere:
+            return spheres
+        spheres.append(sphere)
+
+
+def test_progression_spheres():
+    opts = Options()
+    opts.set_option("dry-run", True)
+    for i in range(2):
+        opts.set_option("seed", i)
+        rando = Randomizer(areas, opts)
+        rando.rando.randomize(useroutput)
+        logic = rando.rando.extract_hint_logic()
+        spheres = logic.calculate_playthrough_progression_spheres()
+        assert spheres == naive_spheres(logic)
+
+
+def test_sots_items():
+    opts = Options()
+    opts.set_option("dry-run", True)
+    rando = Randomizer(areas, opts)
+    rando.rando.randomize(useroutput)
+    logic = rando.rando.extract_hint_logic()
+    inventory = logic.inventory | HINT_BYPASS_BIT
+    for index in logic.goal_indices()[-2:]:
+        usefuls = logic.get_useful_items(index)
+        assert logic.get_sots_items(index) == [
+            item
+            for item in INVENTORY_ITEMS
+            if item in usefuls
+            and not logic.restricted_test(index, [EXTENDED_ITEM[item]], inventory)
+        ]
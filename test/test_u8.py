@@ -50,3 +50,70 @@ def test_add_delete():
     new_paths = list(stagearc.get_all_paths())
     assert len(paths) == len(new_paths)
     assert all([a == b for a, b in zip(paths, new_paths)])
+
+
+def make_arc():
+    # root, dat/{stage.bzs, zev.dat}, oarc/{Alink.arc, Bird.arc, Xyz.arc, End.arc}
+    layout = [
+        ("", 0, 9),
+        ("dat", 0, 4),
+        "stage.bzs",
+        "zev.dat",
+        ("oarc", 0, 9),
+        "Alink.arc",
+        "Bird.arc",
+        "Xyz.arc",
+        "End.arc",
+    ]
+    nodes = []
+    for entry in layout:
+        if isinstance(entry, tuple):
+            name, parent_index, next_parent_index = entry
+            node = sslib.u8file.DirNode(0, parent_index, next_parent_index)
+        else:
+            name = entry
+            node = sslib.u8file.FileNode(0, 0, 0)
+            node.set_data(name.encode())
+        node.set_name(name)
+        nodes.append(node)
+    data = sslib.U8File(memoryview(b""), nodes).to_buffer()
+    return sslib.U8File.parse_u8(BytesIO(data))
+
+
+def test_edit_paths():
+    arc = make_arc()
+    arc.delete_file("oarc/Bird.arc")
+    arc.add_file_data("oarc/Mole.arc", b"mole")
+    arc.add_file_data("dat/room.bzs", b"room")
+    arc.delete_file("dat/zev.dat")
+    assert arc.get_file_data("oarc/Mole.arc") == b"mole"
+    assert arc.get_file("oarc/Bird.arc") is None
+
+    paths = [
+        "/dat/stage.bzs",
+        "/dat/room.bzs",
+        "/oarc/Mole.arc",
+        "/oarc/Alink.arc",
+        "/oarc/Xyz.arc",
+        "/oarc/End.arc",
+    ]
+    assert list(arc.get_all_paths()) == paths
+    # the directories were renumbered
+    reparsed = sslib.U8File.parse_u8(BytesIO(bytes(arc.to_buffer())))
+    assert list(reparsed.get_all_paths()) == paths
+    assert reparsed.get_file_data("dat/room.bzs") == b"room"
+    assert reparsed.get_file_data("/oarc/End.arc") == b"End.arc"
+
+
+def test_write_unmodified_and_modified():
+    arc = make_arc()
+    data = bytes(arc.to_buffer())
+    arc = sslib.U8File.parse_u8(BytesIO(data))
+    arc.set_file_data("oarc/Bird.arc", b"a longer bird than before")
+    arc.set_file_data("oarc/End.arc", b"")
+    out = BytesIO()
+    arc.writeto(out)
+    assert out.getvalue() == arc.to_buffer()
+    reparsed = sslib.U8File.parse_u8(out)
+    assert reparsed.get_file_data("oarc/Bird.arc") == b"a longer bird than before"
+    assert reparsed.get_file_data("oarc/Xyz.arc") == b"Xyz.arc"
@@ -3,9 +3,15 @@ from paths import RANDO_ROOT_PATH
 from pathlib import Path
 import yaml
 
+try:
+    # libyaml bindings, much faster when available
+    from yaml import CSafeLoader as BaseLoader
+except ImportError:
+    from yaml import SafeLoader as BaseLoader
+
 
 # from: https://gist.github.com/pypt/94d747fe5180851196eb?permalink_comment_id=4015118#gistcomment-4015118
-class UniqueKeyLoader(yaml.SafeLoader):
+class UniqueKeyLoader(BaseLoader):
     def construct_mapping(self, node, deep=False):
         mapping = set()
         for key_node, value_node in node.value:
@@ -22,36 +28,26 @@ def yaml_load(file_path: Path):
 
 
 beedle_texts_file = RANDO_ROOT_PATH / "beedle_texts.yaml"
-beedle_texts = yaml_load(beedle_texts_file)
 
 checks_file = RANDO_ROOT_PATH / "checks.yaml"
-checks = yaml_load(checks_file)
 
 eventpatches_file = RANDO_ROOT_PATH / "eventpatches.yaml"
-eventpatches = yaml_load(eventpatches_file)
 
 hints_file = RANDO_ROOT_PATH / "hints.yaml"
-hints = yaml_load(hints_file)
 
 items_file = RANDO_ROOT_PATH / "items.yaml"
-items = yaml_load(items_file)
 
 map_exits_file = RANDO_ROOT_PATH / "entrances.yaml"
-map_exits = yaml_load(map_exits_file)
 
 music_file = RANDO_ROOT_PATH / "music.yaml"
-music = yaml_load(music_file)
 
 options_file = RANDO_ROOT_PATH / "options.yaml"
-options = yaml_load(options_file)
 
 patches_file = RANDO_ROOT_PATH / "patches.yaml"
-patches = yaml_load(patches_file)
 
 glitchless_requirements_file = (
     RANDO_ROOT_PATH / "SS Rando Logic - Glitchless Requirements.yaml"
 )
-glitchless_requirements = yaml_load(glitchless_requirements_file)
 
 
 def requirements_gen(folder: Path):
@@ -68,4 +64,27 @@ def requirements_gen(folder: Path):
 
 
 requirements_folder = RANDO_ROOT_PATH / "logic" / "requirements"
-requirements = requirements_gen(requirements_folder)
+
+
+# The files are only parsed the first time they are accessed
+lazy_loaders = {
+    "beedle_texts": lambda: yaml_load(beedle_texts_file),
+    "checks": lambda: yaml_load(checks_file),
+    "eventpatches": lambda: yaml_load(eventpatches_file),
+    "hints": lambda: yaml_load(hints_file),
+    "items": lambda: yaml_load(items_file),
+    "map_exits": lambda: yaml_load(map_exits_file),
+    "music": lambda: yaml_load(music_file),
+    "options": lambda: yaml_load(options_file),
+    "patches": lambda: yaml_load(patches_file),
+    "glitchless_requirements": lambda: yaml_load(glitchless_requirements_file),
+    "requirements": lambda: requirements_gen(requirements_folder),
+}
+
+
+def __getattr__(name: str):
+    if (loader := lazy_loaders.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = loader()
+    globals()[name] = value
+    return value